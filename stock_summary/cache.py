@@ -0,0 +1,209 @@
+""" Persistent on-disk cache for data fetched from the APIs """
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from stock_summary import settings
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS exchange_rates ("
+    "date TEXT NOT NULL, base TEXT NOT NULL, rates TEXT NOT NULL, "
+    "fetched_at REAL NOT NULL, PRIMARY KEY (date, base))",
+    "CREATE TABLE IF NOT EXISTS quotes ("
+    "symbol TEXT NOT NULL PRIMARY KEY, quote TEXT NOT NULL, fetched_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS checkpoints ("
+    "path TEXT NOT NULL PRIMARY KEY, checkpoint TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS sync_states ("
+    "key TEXT NOT NULL PRIMARY KEY, state TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS reports ("
+    "key TEXT NOT NULL PRIMARY KEY, fingerprint TEXT NOT NULL, content TEXT NOT NULL, "
+    "saved_at REAL NOT NULL)",
+)
+
+
+@contextmanager
+def connect() -> Iterator[sqlite3.Connection]:
+    """
+    Yields connection to the cache database, creates the schema if needed. Changes are
+    committed and the connection is closed on exit.
+    """
+    os.makedirs(settings.CACHE_PATH.parent, exist_ok=True)
+    connection = sqlite3.connect(settings.CACHE_PATH, timeout=10)
+    try:
+        for statement in _SCHEMA:
+            connection.execute(statement)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def load_exchange_rates(
+    date_key: str, base: str, max_age: Optional[float] = None
+) -> Optional[Dict[str, float]]:
+    """
+    Returns cached exchange rates for the date and base. If max_age (in seconds) is set,
+    older records are treated as missing. Returns None if nothing usable is cached.
+    """
+    with connect() as connection:
+        row = connection.execute(
+            "SELECT rates, fetched_at FROM exchange_rates WHERE date = ? AND base = ?",
+            (date_key, base),
+        ).fetchone()
+    if row is None:
+        return None
+    if max_age is not None and time.time() - row[1] > max_age:
+        logging.debug("Cached exchange rates for %s/%s are stale", date_key, base)
+        return None
+    logging.debug("Using cached exchange rates for %s/%s", date_key, base)
+    rates: Dict[str, float] = json.loads(row[0])
+    return rates
+
+
+def save_exchange_rates(date_key: str, base: str, rates: Dict[str, float]) -> None:
+    """Saves exchange rates for the date and base to the cache."""
+    with connect() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO exchange_rates VALUES (?, ?, ?, ?)",
+            (date_key, base, json.dumps(rates), time.time()),
+        )
+    logging.debug("Exchange rates for %s/%s saved to the cache", date_key, base)
+
+
+def load_quotes(
+    symbols: Iterable[str], max_age: Optional[float] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Returns cached quotes for the symbols. If max_age (in seconds) is set, older quotes
+    are left out. Symbols without usable quote are missing in the result.
+    """
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+    with connect() as connection:
+        rows = connection.execute(
+            "SELECT symbol, quote, fetched_at FROM quotes "
+            f"WHERE symbol IN ({', '.join('?' for _ in symbols)})",
+            symbols,
+        ).fetchall()
+    now = time.time()
+    quotes = {
+        symbol: json.loads(quote)
+        for symbol, quote, fetched_at in rows
+        if max_age is None or now - fetched_at <= max_age
+    }
+    logging.debug("Using cached quotes for %s", list(quotes.keys()))
+    return quotes
+
+
+def save_quotes(quotes: Dict[str, Dict[str, Any]]) -> None:
+    """Saves quotes with symbols as keys to the cache."""
+    now = time.time()
+    with connect() as connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO quotes VALUES (?, ?, ?)",
+            [(symbol, json.dumps(quote), now) for symbol, quote in quotes.items()],
+        )
+    logging.debug("Quotes for %s saved to the cache", list(quotes.keys()))
+
+
+def load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    """Returns saved checkpoint of the file on the path or None."""
+    with connect() as connection:
+        row = connection.execute(
+            "SELECT checkpoint FROM checkpoints WHERE path = ?", (path,)
+        ).fetchone()
+    if row is None:
+        return None
+    checkpoint: Dict[str, Any] = json.loads(row[0])
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: Dict[str, Any]) -> None:
+    """Saves checkpoint of the file on the path."""
+    with connect() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?)",
+            (path, json.dumps(checkpoint)),
+        )
+    logging.debug("Checkpoint of %s saved to the cache", path)
+
+
+def clear_checkpoint(path: str) -> None:
+    """Removes checkpoint of the file on the path."""
+    with connect() as connection:
+        connection.execute("DELETE FROM checkpoints WHERE path = ?", (path,))
+
+
+def load_sync_state(key: str) -> Optional[Dict[str, Any]]:
+    """Returns saved state of the last sync of the cloud file with the key or None."""
+    with connect() as connection:
+        row = connection.execute(
+            "SELECT state FROM sync_states WHERE key = ?", (key,)
+        ).fetchone()
+    if row is None:
+        return None
+    state: Dict[str, Any] = json.loads(row[0])
+    return state
+
+
+def save_sync_state(key: str, state: Dict[str, Any]) -> None:
+    """Saves state of the last sync of the cloud file with the key."""
+    with connect() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO sync_states VALUES (?, ?)", (key, json.dumps(state))
+        )
+    logging.debug("Sync state of %s saved to the cache", key)
+
+
+def clear_sync_state(key: str) -> None:
+    """Removes state of the last sync of the cloud file with the key."""
+    with connect() as connection:
+        connection.execute("DELETE FROM sync_states WHERE key = ?", (key,))
+
+
+def load_fetch_times() -> Dict[str, Optional[float]]:
+    """Returns times of the last fetch of quotes and exchange rates to the cache."""
+    with connect() as connection:
+        quotes_at = connection.execute("SELECT MAX(fetched_at) FROM quotes").fetchone()
+        rates_at = connection.execute(
+            "SELECT MAX(fetched_at) FROM exchange_rates"
+        ).fetchone()
+    return {"quotes": quotes_at[0], "exchange_rates": rates_at[0]}
+
+
+def load_report(
+    key: str, fingerprint: str, max_age: Optional[float] = None
+) -> Optional[str]:
+    """
+    Returns saved content of the report part with the key if it was rendered from
+    inputs with the same fingerprint, otherwise None. If max_age (in seconds) is set,
+    older reports are treated as missing.
+    """
+    with connect() as connection:
+        row = connection.execute(
+            "SELECT content, saved_at FROM reports WHERE key = ? AND fingerprint = ?",
+            (key, fingerprint),
+        ).fetchone()
+    if row is None:
+        return None
+    if max_age is not None and time.time() - row[1] > max_age:
+        logging.debug("Cached report %s is stale", key)
+        return None
+    logging.debug("Using cached report %s", key)
+    content: str = row[0]
+    return content
+
+
+def save_report(key: str, fingerprint: str, content: str) -> None:
+    """Saves content of the report part with the key and fingerprint of its inputs."""
+    with connect() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?)",
+            (key, fingerprint, content, time.time()),
+        )
+    logging.debug("Report %s saved to the cache", key)
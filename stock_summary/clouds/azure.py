@@ -1,11 +1,24 @@
 """ Azure cloud instance"""
 import logging
+import os
 import pathlib
+import tempfile
+from typing import IO, Any, Dict, Optional
 
 from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
-from azure.storage.fileshare import ShareClient, ShareFileClient, ShareServiceClient
+from azure.storage.fileshare import (
+    FileProperties,
+    ShareClient,
+    ShareFileClient,
+    ShareServiceClient,
+)
+
+from stock_summary import cache, settings, storage
+from stock_summary.clouds import compression
+from stock_summary.clouds.base import CLOUD_FILES_MAPPING
 
-from stock_summary.settings import DIVIDEND_PATH, ENTRIES_PATH, PORTFOLIO_PATH
+# Maximal size of one range which can be uploaded to the Azure file
+MAX_RANGE_SIZE = 4 * 1024 * 1024
 
 # Azure has really huge and detailed logging messages, we would like to suppress them
 logging.getLogger("azure.core.pipeline.policies.http_logging_policy").setLevel(
@@ -19,11 +32,7 @@ class Azure:
     """
 
     FILE_SHARE = "stocksummary"  # reserved share for the application
-    CLOUD_FILES_MAPPING = {
-        ENTRIES_PATH: ENTRIES_PATH.name,
-        DIVIDEND_PATH: DIVIDEND_PATH.name,
-        PORTFOLIO_PATH: PORTFOLIO_PATH.name,
-    }
+    CLOUD_FILES_MAPPING = CLOUD_FILES_MAPPING
 
     def __init__(self, connection_str: str):
         self._connection_str = connection_str
@@ -32,6 +41,9 @@ class Azure:
         )
         self.check_connection()
         self._share_client = self.get_share_client()
+        if cache.load_sync_state(self._get_state_key()) is not None:
+            logging.debug("Share %s was already created", self.FILE_SHARE)
+            return
         try:
             self._share_client.create_share()
             logging.info("Creating share: %s", self.FILE_SHARE)
@@ -40,6 +52,7 @@ class Azure:
             logging.info(
                 "Share already exists, using the existing one %s", self.FILE_SHARE
             )
+        cache.save_sync_state(self._get_state_key(), {"share_exists": True})
 
     def check_connection(self) -> None:
         """Checks connection and raises error if there is some problem."""
@@ -57,28 +70,204 @@ class Azure:
         share_client = self._service_client.get_share_client(self.FILE_SHARE)
         return share_client
 
-    def sync_file_up(self, local_path: pathlib.Path) -> None:
+    def _get_state_key(self, cloud_path: str = "") -> str:
+        """Returns key of the sync state for the cloud path, empty path is the share."""
+        account_name = self._service_client.account_name
+        return f"azure/{account_name}/{self.FILE_SHARE}/{cloud_path}"
+
+    def _get_file_client(self, cloud_path: str) -> ShareFileClient:
+        """Returns client of the cloud file which shares connections of the share client."""
+        return self._share_client.get_file_client(cloud_path)
+
+    def _handle_not_found(self, err: ResourceNotFoundError) -> None:
+        """Logs the error and forgets the share if it doesn't exist anymore."""
+        logging.error("ResourceNotFoundError:", exc_info=True)
+        if getattr(err, "error_code", None) == "ShareNotFound":
+            cache.clear_sync_state(self._get_state_key())
+
+    @staticmethod
+    def _get_remote_properties(file_client: ShareFileClient) -> Optional[FileProperties]:
+        """Returns properties of the cloud file or None if the file doesn't exist."""
+        try:
+            return file_client.get_file_properties()
+        except ResourceNotFoundError:
+            return None
+
+    @staticmethod
+    def _get_append_state(
+        local_path: pathlib.Path,
+        remote_properties: Optional[FileProperties],
+        state: Optional[Dict[str, Any]],
+    ) -> Optional[Dict[str, Any]]:
         """
-        Syncs file up to the cloud. Only paths from CLOUD_FILES_MAPPING are supported.
-        Cloud path is taken automatically from the mapping.
+        Returns state of the last sync if the cloud file didn't change since then, it's
+        stored with the actual compression and the local file only grew, so its tail
+        can be appended to the cloud file. Otherwise returns None.
+        """
+        if (
+            remote_properties is not None
+            and state is not None
+            and state["etag"] == remote_properties.etag
+            and state.get("remote_size") == remote_properties.size
+            and state.get("compression") == settings.CLOUD_COMPRESSION.value
+            and local_path.stat().st_size > state["local_size"]
+            and storage.file_digest(local_path, state["local_size"])
+            == state["local_hash"]
+        ):
+            return state
+        return None
+
+    @staticmethod
+    def _spool(source: IO[bytes], data: IO[bytes]) -> int:
+        """
+        Replaces content of the data file with the rest of the source compressed by
+        'settings.CLOUD_COMPRESSION' and rewinds it. Returns length of the data.
+        """
+        data.seek(0)
+        data.truncate()
+        compression.compress(source, data, settings.CLOUD_COMPRESSION)
+        length = data.tell()
+        data.seek(0)
+        return length
+
+    @staticmethod
+    def _upload_tail(
+        file_client: ShareFileClient,
+        source: IO[bytes],
+        offset: int,
+        length: int,
+        etag: str,
+    ) -> Optional[str]:
         """
+        Uploads the source with the length as ranges of the cloud file starting at
+        the offset. Azure files don't support conditional writes, so the file is leased
+        meanwhile and the tail is uploaded only if the leased file still has the ETag.
+        Returns new ETag of the cloud file or None if it was changed by someone else.
+        """
+        lease = file_client.acquire_lease()
         try:
-            with open(local_path, "rb") as source_file:
-                data = source_file.read()
-                dest_path = self.CLOUD_FILES_MAPPING[local_path]
-                file_client: ShareFileClient = ShareFileClient.from_connection_string(
-                    self._connection_str, self.FILE_SHARE, dest_path
+            if file_client.get_file_properties().etag != etag:
+                return None
+            response = file_client.resize_file(offset + length, lease=lease)
+            while True:
+                chunk = source.read(MAX_RANGE_SIZE)
+                if not chunk:
+                    break
+                response = file_client.upload_range(
+                    chunk, offset=offset, length=len(chunk), lease=lease
                 )
+                offset += len(chunk)
+        finally:
+            lease.release()
+        new_etag: str = response["etag"]
+        return new_etag
 
-                logging.info("Uploading to: %s/%s", self.FILE_SHARE, dest_path)
-                file_client.upload_file(data)
+    @staticmethod
+    def _download_to_file(
+        file_client: ShareFileClient, path: pathlib.Path
+    ) -> Dict[str, Any]:
+        """
+        Streams the cloud file chunk by chunk into a temporary file next to the path,
+        decompresses it if it's compressed and atomically replaces the path with it,
+        so a failed download never replaces the local copy. Returns ETag, size and
+        compression of the cloud file.
+        """
+        os.makedirs(path.parent, exist_ok=True)
+        with tempfile.TemporaryFile() as downloaded, storage.open_temp_file(
+            path
+        ) as temp_file:
+            try:
+                stream = file_client.download_file()
+                stream.readinto(downloaded)
+                remote_size = downloaded.tell()
+                detected = compression.decompress(downloaded, temp_file)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            except BaseException:
+                temp_file.close()
+                os.unlink(temp_file.name)
+                raise
+        os.replace(temp_file.name, path)
+        return {
+            "etag": stream.properties.etag,
+            "remote_size": remote_size,
+            "compression": detected.value,
+        }
+
+    def sync_file_up(self, local_path: pathlib.Path) -> int:
+        """
+        Syncs file up to the cloud. Only paths from CLOUD_FILES_MAPPING are supported.
+        Cloud path is taken automatically from the mapping. Upload is skipped if neither
+        the local file nor the cloud file changed since the last sync. If the local file
+        was only appended, just the new tail is uploaded, unless the cloud file changed
+        meanwhile, then the whole file is uploaded. File is compressed in the cloud by
+        'settings.CLOUD_COMPRESSION'. Returns number of uploaded bytes.
+        """
+        try:
+            dest_path = self.CLOUD_FILES_MAPPING[local_path]
+            file_client = self._get_file_client(dest_path)
+            state_key = self._get_state_key(dest_path)
+            local_hash = storage.file_digest(local_path)
+            state = cache.load_sync_state(state_key)
+            remote_properties = self._get_remote_properties(file_client)
+            if (
+                state is not None
+                and remote_properties is not None
+                and state["local_hash"] == local_hash
+                and remote_properties.etag == state["etag"]
+            ):
+                logging.info("File %s didn't change, skipping upload", dest_path)
+                return 0
+            append_state = self._get_append_state(local_path, remote_properties, state)
+            # Stream the file from disk, the data are spooled to a temporary file
+            with open(local_path, "rb") as source_file, (
+                tempfile.TemporaryFile()
+            ) as data:
+                etag: Optional[str] = None
+                remote_offset = 0
+                if append_state is not None:
+                    remote_offset = append_state["remote_size"]
+                    source_file.seek(append_state["local_size"])
+                    length = self._spool(source_file, data)
+                    logging.info(
+                        "Appending to: %s/%s from %s",
+                        self.FILE_SHARE,
+                        dest_path,
+                        remote_offset,
+                    )
+                    etag = self._upload_tail(
+                        file_client, data, remote_offset, length, append_state["etag"]
+                    )
+                    if etag is None:
+                        logging.warning(
+                            "File %s changed in the cloud, uploading whole file",
+                            dest_path,
+                        )
+                        source_file.seek(0)
+                        remote_offset = 0
+                if etag is None:
+                    length = self._spool(source_file, data)
+                    logging.info("Uploading to: %s/%s", self.FILE_SHARE, dest_path)
+                    etag = file_client.upload_file(data, length=length)["etag"]
+                local_size = source_file.tell()
+            cache.save_sync_state(
+                state_key,
+                {
+                    "etag": etag,
+                    "local_hash": local_hash,
+                    "local_size": local_size,
+                    "remote_size": remote_offset + length,
+                    "compression": settings.CLOUD_COMPRESSION.value,
+                },
+            )
+            return length
 
         except ResourceExistsError as err:
             logging.error("ResourceExistsError:", exc_info=True)
             raise err
 
         except ResourceNotFoundError as err:
-            logging.error("ResourceNotFoundError:", exc_info=True)
+            self._handle_not_found(err)
             raise err
         except KeyError as err:
             logging.error(
@@ -87,30 +276,44 @@ class Azure:
             )
             raise err
 
-    def sync_file_down(self, dst_file_name: pathlib.Path) -> None:
+    def sync_file_down(self, dst_file_name: pathlib.Path) -> int:
         """
         Syncs file down from the cloud. Only paths from CLOUD_FILES_MAPPING are supported.
-        Cloud path is taken automatically from the mapping.
+        Cloud path is taken automatically from the mapping. Download is skipped if neither
+        the local file nor the cloud file changed since the last sync. Returns number
+        of downloaded bytes.
         """
         try:
             source_file_name = self.CLOUD_FILES_MAPPING[dst_file_name]
 
-            # Create a ShareFileClient from a connection string
-            file_client: ShareFileClient = ShareFileClient.from_connection_string(
-                self._connection_str, self.FILE_SHARE, source_file_name
-            )
+            file_client = self._get_file_client(source_file_name)
+            state_key = self._get_state_key(source_file_name)
+            state = cache.load_sync_state(state_key)
+            if (
+                state is not None
+                and state["etag"] == file_client.get_file_properties().etag
+                and dst_file_name.exists()
+                and storage.file_digest(dst_file_name) == state["local_hash"]
+            ):
+                logging.info("File %s didn't change, skipping download", dst_file_name)
+                return 0
 
             logging.info("Downloading to: %s", dst_file_name)
 
-            # Open a file for writing bytes on the local system
-            with open(dst_file_name, "wb") as data:
-                # Download the file from Azure into a stream
-                stream = file_client.download_file()
-                # Write the stream to the local file
-                data.write(stream.readall())
+            remote_state = self._download_to_file(file_client, dst_file_name)
+            cache.save_sync_state(
+                state_key,
+                {
+                    **remote_state,
+                    "local_hash": storage.file_digest(dst_file_name),
+                    "local_size": dst_file_name.stat().st_size,
+                },
+            )
+            transferred: int = remote_state["remote_size"]
+            return transferred
 
         except ResourceNotFoundError as err:
-            logging.error("ResourceNotFoundError:", exc_info=True)
+            self._handle_not_found(err)
             raise err
         except KeyError as err:
             logging.error(
@@ -0,0 +1,34 @@
+""" Interface of the cloud backends """
+import pathlib
+from typing import Dict, Protocol
+
+from stock_summary.settings import (
+    DIVIDEND_PATH,
+    ENTRIES_PATH,
+    LEDGER_PATH,
+    PORTFOLIO_PATH,
+)
+
+# Local data files and their paths inside the cloud
+CLOUD_FILES_MAPPING: Dict[pathlib.Path, str] = {
+    ENTRIES_PATH: ENTRIES_PATH.name,
+    DIVIDEND_PATH: DIVIDEND_PATH.name,
+    PORTFOLIO_PATH: PORTFOLIO_PATH.name,
+    LEDGER_PATH: LEDGER_PATH.name,
+}
+
+
+class Cloud(Protocol):
+    """
+    Backend which syncs data files with the cloud. Only paths from CLOUD_FILES_MAPPING
+    are supported, sync methods return number of transferred bytes.
+    """
+
+    def check_connection(self) -> None:
+        """Checks connection and raises error if there is some problem."""
+
+    def sync_file_up(self, local_path: pathlib.Path) -> int:
+        """Syncs file up to the cloud."""
+
+    def sync_file_down(self, dst_file_name: pathlib.Path) -> int:
+        """Syncs file down from the cloud."""
@@ -0,0 +1,48 @@
+""" Compression of the data files stored in the cloud """
+import gzip
+import shutil
+from typing import IO
+
+from stock_summary.help_structures import CloudCompression
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def detect_compression(source: IO[bytes]) -> CloudCompression:
+    """
+    Returns compression of the file by its magic bytes. Position of the file is moved
+    back to the start.
+    """
+    source.seek(0)
+    magic = source.read(len(GZIP_MAGIC))
+    source.seek(0)
+    return CloudCompression.GZIP if magic == GZIP_MAGIC else CloudCompression.NONE
+
+
+def compress(
+    source: IO[bytes], destination: IO[bytes], compression: CloudCompression
+) -> None:
+    """
+    Streams the source to the destination compressed by the compression. Gzip members
+    can be concatenated, so compressed tail of the file can be appended to the
+    compressed file.
+    """
+    if compression == CloudCompression.GZIP:
+        with gzip.GzipFile(fileobj=destination, mode="wb", mtime=0) as gzip_file:
+            shutil.copyfileobj(source, gzip_file)
+    else:
+        shutil.copyfileobj(source, destination)
+
+
+def decompress(source: IO[bytes], destination: IO[bytes]) -> CloudCompression:
+    """
+    Streams the source to the destination decompressed by the detected compression.
+    Returns the detected compression.
+    """
+    compression = detect_compression(source)
+    if compression == CloudCompression.GZIP:
+        with gzip.GzipFile(fileobj=source, mode="rb") as gzip_file:
+            shutil.copyfileobj(gzip_file, destination)
+    else:
+        shutil.copyfileobj(source, destination)
+    return compression
@@ -0,0 +1,134 @@
+""" Local cloud instance, syncs data files to a directory or a mounted network drive"""
+import logging
+import os
+import pathlib
+import shutil
+from typing import Any, Dict, Optional
+
+from stock_summary import cache, storage
+from stock_summary.clouds.base import CLOUD_FILES_MAPPING
+
+
+class LocalCloud:
+    """
+    Cloud in the local directory. It provides needed methods to sync data files
+    """
+
+    CLOUD_FILES_MAPPING = CLOUD_FILES_MAPPING
+
+    def __init__(self, root: pathlib.Path):
+        self._root = root.resolve()
+        self.check_connection()
+
+    def check_connection(self) -> None:
+        """
+        Checks that the directory is available and raises error if it isn't. It isn't
+        created, so unmounted network drive isn't replaced by an empty directory.
+        """
+        if not self._root.is_dir():
+            err_msg = (
+                f"Unable to use the directory {self._root} as cloud, it doesn't exist."
+            )
+            logging.error(err_msg)
+            raise FileNotFoundError(err_msg)
+
+    def _get_state_key(self, cloud_path: str) -> str:
+        """Returns key of the sync state for the cloud path."""
+        return f"local/{self._root}/{cloud_path}"
+
+    @staticmethod
+    def _get_remote_state(path: pathlib.Path) -> Optional[Dict[str, Any]]:
+        """Returns size and modification time of the cloud file or None."""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    @staticmethod
+    def _copy_file(source: pathlib.Path, destination: pathlib.Path) -> int:
+        """
+        Copies the source to a temporary file next to the destination and atomically
+        replaces the destination with it, mode of the destination is kept. Returns
+        number of copied bytes.
+        """
+        with storage.open_temp_file(destination) as temp_file:
+            try:
+                with open(source, "rb") as source_file:
+                    shutil.copyfileobj(source_file, temp_file)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            except BaseException:
+                temp_file.close()
+                os.unlink(temp_file.name)
+                raise
+        os.replace(temp_file.name, destination)
+        return destination.stat().st_size
+
+    def _sync_file(
+        self, source: pathlib.Path, destination: pathlib.Path, cloud_path: str
+    ) -> int:
+        """
+        Copies the source to the destination unless neither of them changed since
+        the last sync. Returns number of copied bytes.
+        """
+        remote_path = self._root.joinpath(cloud_path)
+        local_path = destination if source == remote_path else source
+        state_key = self._get_state_key(cloud_path)
+        state = cache.load_sync_state(state_key)
+        if (
+            state is not None
+            and state["remote"] == self._get_remote_state(remote_path)
+            and local_path.exists()
+            and storage.file_digest(local_path) == state["local_hash"]
+        ):
+            logging.info("File %s didn't change, skipping sync", cloud_path)
+            return 0
+        logging.info("Copying %s to %s", source, destination)
+        if destination == remote_path:
+            # Only subdirectories of the cloud file are created in the existing root
+            self.check_connection()
+        os.makedirs(destination.parent, exist_ok=True)
+        transferred = self._copy_file(source, destination)
+        cache.save_sync_state(
+            state_key,
+            {
+                "remote": self._get_remote_state(remote_path),
+                "local_hash": storage.file_digest(local_path),
+            },
+        )
+        return transferred
+
+    def sync_file_up(self, local_path: pathlib.Path) -> int:
+        """
+        Syncs file up to the directory. Only paths from CLOUD_FILES_MAPPING are
+        supported. Copy is skipped if neither the local file nor the cloud file changed
+        since the last sync. Returns number of copied bytes.
+        """
+        try:
+            cloud_path = self.CLOUD_FILES_MAPPING[local_path]
+        except KeyError as err:
+            logging.error(
+                "Trying to sync path which doesn't have mapping in the cloud.",
+                exc_info=True,
+            )
+            raise err
+        return self._sync_file(local_path, self._root.joinpath(cloud_path), cloud_path)
+
+    def sync_file_down(self, dst_file_name: pathlib.Path) -> int:
+        """
+        Syncs file down from the directory. Only paths from CLOUD_FILES_MAPPING are
+        supported. Copy is skipped if neither the local file nor the cloud file changed
+        since the last sync. Returns number of copied bytes.
+        """
+        try:
+            cloud_path = self.CLOUD_FILES_MAPPING[dst_file_name]
+        except KeyError as err:
+            logging.error(
+                "Trying to sync path which doesn't have mapping in the cloud.",
+                exc_info=True,
+            )
+            raise err
+        return self._sync_file(
+            self._root.joinpath(cloud_path), dst_file_name, cloud_path
+        )
@@ -1,14 +1,22 @@
 """ Main cloud logic which is then delegated to Cloud instances"""
 import logging
 import pathlib
-from typing import Optional, Sequence
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence
 
-from stock_summary import settings
-from stock_summary.clouds.azure import Azure
-from stock_summary.help_structures import CloudType
+from stock_summary import profiling, settings, storage
+from stock_summary.clouds.base import Cloud
+from stock_summary.clouds.local import LocalCloud
+from stock_summary.help_structures import CloudType, SyncStats
 
+# Azure SDK is imported only when the Azure cloud is used
+if TYPE_CHECKING:
+    from stock_summary.clouds.azure import Azure
 
-def get_cloud(cloud_type: Optional[CloudType] = None) -> Optional[Azure]:
+
+def get_cloud(cloud_type: Optional[CloudType] = None) -> Optional[Cloud]:
     """
     Returns needed type of the cloud. You can pass type of the cloud that you want
     or the actual 'settings.CLOUD_TYPE' variable is taken.
@@ -16,6 +24,15 @@ def get_cloud(cloud_type: Optional[CloudType] = None) -> Optional[Azure]:
     cloud_type = cloud_type if cloud_type is not None else settings.CLOUD_TYPE
     if cloud_type == CloudType.NONE:
         return None
+    if cloud_type == CloudType.LOCAL:
+        if settings.LOCAL_CLOUD_PATH is None:
+            err_msg = (
+                "Using local cloud without path is impossible. "
+                "Set path to the directory, or turn off the cloud."
+            )
+            logging.error(err_msg)
+            raise ValueError(err_msg)
+        return LocalCloud(settings.LOCAL_CLOUD_PATH)
     if settings.AZURE_CONNECTION_STR is None:
         err_msg = (
             "Using Azure cloud without connection string is impossible. "
@@ -24,54 +41,122 @@ def get_cloud(cloud_type: Optional[CloudType] = None) -> Optional[Azure]:
         logging.error(err_msg)
 
         raise ValueError(err_msg)
-    cloud = Azure(settings.AZURE_CONNECTION_STR)
-    return cloud
+    return _get_azure(settings.AZURE_CONNECTION_STR)
+
+
+@lru_cache()
+def _get_azure(connection_str: str) -> "Azure":
+    """
+    Returns Azure cloud for the connection string. Instance is created once per process,
+    so all syncs reuse its pooled connections.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from stock_summary.clouds.azure import Azure
+
+    return Azure(connection_str)
 
 
 def sync_files_down(
     cloud_type: Optional[CloudType] = None,
     paths: Optional[Sequence[pathlib.Path]] = None,
-) -> None:
+) -> List[SyncStats]:
     """
     Sync files down from the cloud. You can specify type of the cloud and paths to local
     files that you want to sync. They are mapped in Cloud logic to their paths inside
-    the cloud.
+    the cloud. Returns transferred bytes and duration of the sync of each file.
     """
     cloud_type = cloud_type if cloud_type is not None else settings.CLOUD_TYPE
     logging.info("Syncing files %s down from the cloud %s", paths, cloud_type.value)
     cloud = get_cloud(cloud_type=cloud_type)
     if cloud is None:
         logging.info("Cloud not set, nothing to sync. Continuing with local data.")
-        return
+        return []
     paths = (
-        paths
+        list(dict.fromkeys(storage.get_file_path(path) for path in paths))
         if paths is not None
-        else [settings.ENTRIES_PATH, settings.DIVIDEND_PATH, settings.PORTFOLIO_PATH]
+        else storage.get_data_paths()
     )
-    for path in paths:
-        cloud.sync_file_down(path)
+    return _sync_files(cloud.sync_file_down, paths, "cloud.sync_down")
 
 
 def sync_files_up(
     cloud_type: Optional[CloudType] = None,
     paths: Optional[Sequence[pathlib.Path]] = None,
-) -> None:
+) -> List[SyncStats]:
     """
     Sync files to the cloud. You can specify type of the cloud and paths to local
     files that you want to sync. They are mapped in Cloud logic to their paths inside
-    the cloud.
+    the cloud. Returns transferred bytes and duration of the sync of each file.
     """
     cloud_type = cloud_type if cloud_type is not None else settings.CLOUD_TYPE
     logging.info("Syncing files %s up to the cloud %s", paths, cloud_type.value)
     cloud = get_cloud(cloud_type=cloud_type)
     if cloud is None:
         logging.info("Cloud not set, nothing to sync. Continuing with local data.")
-        return
+        return []
     paths = (
-        paths
+        list(dict.fromkeys(storage.get_file_path(path) for path in paths))
         if paths is not None
-        else [settings.ENTRIES_PATH, settings.DIVIDEND_PATH, settings.PORTFOLIO_PATH]
+        else storage.get_data_paths()
     )
+    return _sync_files(cloud.sync_file_up, paths, "cloud.sync_up")
 
-    for path in paths:
-        cloud.sync_file_up(path)
+
+def _timed_sync(
+    sync_file: Callable[[pathlib.Path], int], path: pathlib.Path, stage_name: str
+) -> SyncStats:
+    """
+    Syncs file of the path and measures transferred bytes and duration, they are
+    recorded as the profiling stage too.
+    """
+    start = time.perf_counter()
+    transferred = sync_file(path)
+    duration = time.perf_counter() - start
+    profiling.record(stage_name, duration, transferred)
+    logging.debug(
+        "Synced %s: %s bytes in %.3f s (%.2f MiB/s)",
+        path,
+        transferred,
+        duration,
+        transferred / max(duration, 1e-9) / 1024**2,
+    )
+    return SyncStats(path, transferred, duration)
+
+
+def _sync_files(
+    sync_file: Callable[[pathlib.Path], int],
+    paths: Sequence[pathlib.Path],
+    stage_name: str,
+) -> List[SyncStats]:
+    """
+    Syncs files of the paths concurrently by 'settings.CLOUD_SYNC_WORKERS' threads.
+    Failure of each file is logged and the first one is raised after all syncs finish.
+    Returns transferred bytes and duration of the sync of each file.
+    """
+    if not paths:
+        return []
+    start = time.perf_counter()
+    workers = min(max(settings.CLOUD_SYNC_WORKERS, 1), len(paths))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            path: executor.submit(_timed_sync, sync_file, path, stage_name)
+            for path in paths
+        }
+    errors: Dict[pathlib.Path, BaseException] = {}
+    stats: List[SyncStats] = []
+    for path, future in futures.items():
+        error = future.exception()
+        if error is not None:
+            logging.error("Sync of the file %s failed: %s", path, error)
+            errors[path] = error
+        else:
+            stats.append(future.result())
+    if errors:
+        raise next(iter(errors.values()))
+    logging.info(
+        "Synced %s files, %s bytes transferred in %.3f s",
+        len(stats),
+        sum(stat.transferred for stat in stats),
+        time.perf_counter() - start,
+    )
+    return stats
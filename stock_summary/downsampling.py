@@ -0,0 +1,35 @@
+""" Downsampling of long time series for the plots """
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Returns sorted indices of the points selected by Largest-Triangle-Three-Buckets
+    algorithm, so the series keeps its visual shape with the given count of points.
+    First and last points are always kept. Series with at most the count of points
+    or counts lower than 3 return all indices.
+    """
+    length = len(x)
+    if points < 3 or length <= points:
+        return np.arange(length)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Inner points are split to buckets, first and last points have their own
+    edges = np.linspace(1, length - 1, points - 1).astype(int)
+    selected = np.empty(points, dtype=int)
+    selected[0] = 0
+    selected[-1] = length - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The third vertex is the average of the next bucket (or the last point)
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        selected[bucket + 1] = previous
+    return selected
@@ -1,16 +1,32 @@
 """ Help structures as enums and typed dicts"""
 import logging
+import pathlib
 from enum import Enum
-from typing import TypedDict
+from typing import Any, Dict, NamedTuple, TypedDict
 
 
 class CloudType(Enum):
     """Enum which describes type of the cloud"""
 
     AZURE = "azure"
+    LOCAL = "local"
     NONE = "none"
 
 
+class StorageType(Enum):
+    """Enum which describes type of the storage for data files"""
+
+    TEXT = "text"
+    SQLITE = "sqlite"
+
+
+class CloudCompression(Enum):
+    """Enum which describes compression of the data files in the cloud"""
+
+    NONE = "none"
+    GZIP = "gzip"
+
+
 class LoggingSettings(Enum):
     """Enum which saves settings for logging"""
 
@@ -36,3 +52,63 @@ class Dividend(TypedDict):
     symbol: str
     converted_value: float
     value: float
+
+
+class Snapshot(TypedDict):
+    """Valuation saved by generate-portfolio, generate-html renders from it"""
+
+    created_at: float
+    data_digests: Dict[str, str]
+    exchange_rates: Dict[str, float]
+    prices: Dict[str, Dict[str, Any]]
+    summary: Dict[str, SummaryDict]
+    dividends: Dict[str, Dividend]
+
+
+class EntryRow(NamedTuple):
+    """One row of the entries file"""
+
+    date: str
+    pair: str
+    quantity: float
+    price: float
+    converted_amount: float
+
+
+class DividendRow(NamedTuple):
+    """One row of the dividends file"""
+
+    date: str
+    pair: str
+    amount: float
+    converted_amount: float
+
+
+class PortfolioRow(NamedTuple):
+    """One row of the portfolio file"""
+
+    date: str
+    total_price: float
+    profit: float
+
+
+class Holding(NamedTuple):
+    """Aggregated entries of one stock"""
+
+    quantity: float
+    cost_basis: float
+
+
+class DividendTotal(NamedTuple):
+    """Aggregated dividends of one stock"""
+
+    amount: float
+    converted_amount: float
+
+
+class SyncStats(NamedTuple):
+    """Transferred bytes and duration of the sync of one file"""
+
+    path: pathlib.Path
+    transferred: int
+    duration: float
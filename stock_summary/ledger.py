@@ -0,0 +1,62 @@
+""" Ledger with entries and dividends parsed once per command """
+import logging
+import pathlib
+from typing import Dict, Optional, Set
+
+from stock_summary import settings, storage
+from stock_summary.help_structures import DividendTotal, Holding
+
+
+class Ledger:
+    """
+    Parsed entries and dividends. Load it once per command and pass it to the functions
+    which need pairs, holdings or dividends, instead of reading the data files again.
+    """
+
+    def __init__(
+        self, holdings: Dict[str, Holding], dividends: Dict[str, DividendTotal]
+    ):
+        self.holdings = holdings
+        self.dividends = dividends
+
+    @classmethod
+    def load(
+        cls,
+        entries_path: Optional[pathlib.Path] = None,
+        dividend_path: Optional[pathlib.Path] = None,
+    ) -> "Ledger":
+        """Loads ledger from the data files, default paths are taken from settings."""
+        entries_path = entries_path if entries_path is not None else settings.ENTRIES_PATH
+        dividend_path = (
+            dividend_path if dividend_path is not None else settings.DIVIDEND_PATH
+        )
+        ledger = cls(
+            storage.aggregate_entries(entries_path),
+            storage.aggregate_dividends(dividend_path),
+        )
+        logging.debug(
+            "Loaded ledger with %s pairs and %s dividend pairs",
+            len(ledger.holdings),
+            len(ledger.dividends),
+        )
+        return ledger
+
+    @property
+    def pairs(self) -> Set[str]:
+        """Returns all pairs from the entries."""
+        return set(self.holdings.keys())
+
+    @property
+    def dividend_pairs(self) -> Set[str]:
+        """Returns all pairs from the dividends."""
+        return set(self.dividends.keys())
+
+    @property
+    def cost_basis(self) -> float:
+        """Returns cost basis of all entries."""
+        return sum(holding.cost_basis for holding in self.holdings.values())
+
+    @property
+    def dividend_sum(self) -> float:
+        """Returns sum of all converted dividends."""
+        return sum(dividend.converted_amount for dividend in self.dividends.values())
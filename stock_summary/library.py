@@ -1,72 +1,196 @@
 """ library functions """
 import csv
 import datetime
+import hashlib
 import json
 import logging
 import os
 import pathlib
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from typing import Any, Dict, List, Mapping, Optional, Set
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
-import dotenv
-import pandas as pd
-import plotly.graph_objects as go
-import requests
-from plotly.subplots import make_subplots
 from pydantic import parse_obj_as
 
-from stock_summary import settings
-from stock_summary.help_structures import Dividend, SummaryDict
-from stock_summary.validation import ExchangeRates, PairResponse
+from stock_summary import cache, profiling, settings, storage
+from stock_summary.help_structures import (
+    Dividend,
+    DividendRow,
+    EntryRow,
+    PortfolioRow,
+    Snapshot,
+    SummaryDict,
+)
+from stock_summary.ledger import Ledger
+from stock_summary.validation import ExchangeRates, PairResponse, PriceHistory
+
+# Modules with code which renders the plot and the whole HTML report, cached parts
+# are rendered again when they change
+PLOT_MODULES = ("downsampling", "library", "storage")
+REPORT_MODULES = (*PLOT_MODULES, "main", "snapshot", "valuation")
+
+# Heavy dependencies (pandas, plotly, requests) are imported inside the functions
+# which need them, so commands without them start fast
+if TYPE_CHECKING:
+    import requests
+
+
+@lru_cache()
+def get_http_session() -> "requests.Session":
+    """
+    Returns HTTP session shared by all API calls, so connections are pooled and reused.
+    """
+    import requests  # pylint: disable=import-outside-toplevel
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_maxsize=max(settings.STOCK_PRICE_WORKERS, 1)
+    )
+    session.mount("https://", adapter)
+    return session
 
 
 @lru_cache()
 def get_exchange_rates(
     date: Optional[datetime.datetime] = None, base_pair: str = "CZK"
 ) -> Dict[str, float]:
-    """Returns dict with actual values for conversions between other currencies and CZK"""
-    url = (
-        f"{settings.EXCHANGE_RATE_URL}/latest"
-        if date is None
-        else f"{settings.EXCHANGE_RATE_URL}/{date.strftime('%Y-%m-%d')}"
-    )
-    response = requests.request(
-        "GET",
-        url,
-        timeout=10,
-        headers=settings.EXCHANGE_RATE_HEADERS,
-        params={"base": base_pair},
+    """
+    Returns dict with actual values for conversions between other currencies and CZK.
+    Rates are cached on the disk, past dates forever and the latest ones for
+    'settings.EXCHANGE_RATE_TTL' seconds.
+    """
+    date_key = "latest" if date is None else date.strftime("%Y-%m-%d")
+    is_final = date is not None and date.date() < datetime.date.today()
+    cached_rates = cache.load_exchange_rates(
+        date_key, base_pair, max_age=None if is_final else settings.EXCHANGE_RATE_TTL
     )
+    if cached_rates is not None:
+        return cached_rates
+    url = f"{settings.EXCHANGE_RATE_URL}/{date_key}"
+    with profiling.stage("api.exchange_rates") as stage_record:
+        response = get_http_session().request(
+            "GET",
+            url,
+            timeout=10,
+            headers=settings.EXCHANGE_RATE_HEADERS,
+            params={"base": base_pair},
+        )
+        stage_record.add_bytes(len(response.content))
     exchange_response = ExchangeRates(base_requested="CZK", **json.loads(response.text))
     exchange_dict = {}
     for key, value in exchange_response.rates.items():
         exchange_dict[key] = 1 / value
+    cache.save_exchange_rates(date_key, base_pair, exchange_dict)
     logging.debug("Returning exchange dict %s", exchange_dict)
     return exchange_dict
 
 
-def get_pair_prices(pairs: Set[str]) -> Dict[str, PairResponse]:
+def get_pair_prices(
+    pairs: Set[str], max_age: Optional[float] = None
+) -> Dict[str, PairResponse]:
+    """
+    Returns actual prices for the pairs. Quotes younger than max_age seconds
+    (default 'settings.QUOTE_TTL') are taken from the cache, only missing and stale
+    ones are requested from the API.
+    """
+    max_age = max_age if max_age is not None else settings.QUOTE_TTL
+    # Requested pairs are passed to each response, concurrent calls don't share them
+    result_dict = {
+        symbol: PairResponse(pairs=set(pairs), **quote)
+        for symbol, quote in cache.load_quotes(pairs, max_age=max_age).items()
+    }
+    missing_pairs = set(pairs) - set(result_dict.keys())
+    if missing_pairs:
+        fetched_dict = _fetch_pair_prices(missing_pairs)
+        cache.save_quotes(
+            {
+                symbol: result.dict(exclude={"pairs"})
+                for symbol, result in fetched_dict.items()
+            }
+        )
+        result_dict.update(fetched_dict)
+    logging.debug(f"Returning pair_prices {result_dict}")
+    return result_dict
+
+
+def _fetch_pair_prices(pairs: Set[str]) -> Dict[str, PairResponse]:
+    """
+    Requests prices of the pairs from the API. Pairs are split into chunks of
+    'settings.STOCK_PRICE_CHUNK_SIZE' symbols which are fetched concurrently.
+    """
+    sorted_pairs = sorted(pairs)
+    chunk_size = max(settings.STOCK_PRICE_CHUNK_SIZE, 1)
+    chunks = [
+        sorted_pairs[index : index + chunk_size]
+        for index in range(0, len(sorted_pairs), chunk_size)
+    ]
+    result_dict: Dict[str, PairResponse] = {}
+    if len(chunks) == 1:
+        result_dict.update(_fetch_pair_prices_chunk(chunks[0]))
+        return result_dict
+    workers = min(max(settings.STOCK_PRICE_WORKERS, 1), len(chunks))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk_result in executor.map(_fetch_pair_prices_chunk, chunks):
+            result_dict.update(chunk_result)
+    return result_dict
+
+
+def _fetch_pair_prices_chunk(pairs: List[str]) -> Dict[str, PairResponse]:
     """
     Search for price on url and xpath, if error occurs, raises error.
     """
     url = f"{settings.STOCK_PRICE_URL}/{','.join(pairs)}"
 
-    response = requests.request(
-        "GET", url, headers=settings.STOCK_PRICE_HEADERS, timeout=10
-    )
+    with profiling.stage("api.quotes") as stage_record:
+        response = get_http_session().request(
+            "GET", url, headers=settings.STOCK_PRICE_HEADERS, timeout=10
+        )
+        stage_record.add_bytes(len(response.content))
     logging.debug("Requesting URL %s with response %s", url, response.text)
-    PairResponse.pairs = set(pairs)
     result_list: List[PairResponse] = parse_obj_as(
-        List[PairResponse], json.loads(response.text)["body"]
+        List[PairResponse],
+        [{**item, "pairs": set(pairs)} for item in json.loads(response.text)["body"]],
     )
     result_dict = {}
     for result in result_list:
         result_dict[result.symbol] = result
-    logging.debug(f"Returning pair_prices {result_dict}")
     return result_dict
 
 
+def get_price_history(pair: str) -> PriceHistory:
+    """Returns daily price history of the pair."""
+    url = f"{settings.STOCK_HISTORY_URL}/{pair}/1d"
+    with profiling.stage("api.price_history") as stage_record:
+        response = get_http_session().request(
+            "GET", url, headers=settings.STOCK_PRICE_HEADERS, timeout=30
+        )
+        stage_record.add_bytes(len(response.content))
+    logging.debug("Requesting URL %s with status %s", url, response.status_code)
+    return PriceHistory(**json.loads(response.text))
+
+
+def get_price_histories(pairs: Set[str]) -> Dict[str, PriceHistory]:
+    """Returns daily price histories of the pairs, each pair is fetched concurrently."""
+    sorted_pairs = sorted(pairs)
+    if not sorted_pairs:
+        return {}
+    workers = min(max(settings.STOCK_PRICE_WORKERS, 1), len(sorted_pairs))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(sorted_pairs, executor.map(get_price_history, sorted_pairs)))
+
+
 def validate_date(date_text: str) -> datetime.datetime:
     """Validates date to our custom format."""
     try:
@@ -78,66 +202,182 @@ def validate_date(date_text: str) -> datetime.datetime:
 
 
 def get_entries_summary(
-    entries_path: pathlib.Path = settings.ENTRIES_PATH,
+    entries_path: Optional[pathlib.Path] = None,
+    ledger: Optional[Ledger] = None,
 ) -> Dict[str, SummaryDict]:
     """
     Returns entries summary with keys as stock symbols and values as dicts with all important
-    values (see TypedDict) in settings.
-    """
-    entries_dict: Dict[str, SummaryDict] = {}
-    with open(entries_path, newline="", encoding="utf-8") as csvfile:
-        entries = csv.reader(csvfile, delimiter=" ", quotechar="|")
-        next(entries)
-        for entry in entries:
-            if entry[1] not in entries_dict:
-                entries_dict[entry[1]] = {
-                    "symbol": entry[1],
-                    "count": 0,
-                    "cost_basis": 0,
-                    "actual_basis": 0,
-                    "currency": "",
-                    "actual_price": 0,
-                }
-            entries_dict[entry[1]]["count"] += float(entry[2])
-            entries_dict[entry[1]]["cost_basis"] += float(entry[4])
+    values (see TypedDict) in settings. Holdings are taken from the ledger if it's passed.
+    """
+    if ledger is not None:
+        holdings = ledger.holdings
+    else:
+        holdings = storage.aggregate_entries(
+            entries_path if entries_path is not None else settings.ENTRIES_PATH
+        )
+    # pylint: disable-next=import-outside-toplevel
+    from stock_summary.valuation import to_summary, value_holdings
+
     exchange_rates = get_exchange_rates()
-    pair_prices = get_pair_prices(set(entries_dict.keys()))
-    for key, value in entries_dict.items():
-        if value["count"] != 0:
-            value["currency"] = pair_prices[key].currency
-            value["actual_price"] = pair_prices[key].regularMarketPrice
-            value["actual_basis"] = (
-                value["count"] * pair_prices[key].regularMarketPrice
-            ) * exchange_rates[pair_prices[key].currency]
+    pair_prices = get_pair_prices(set(holdings.keys()))
+    entries_dict = to_summary(value_holdings(holdings, pair_prices, exchange_rates))
     logging.debug(f"Returning entries summary {entries_dict}")
     return entries_dict
 
 
 def prepare_portfolio_data() -> Any:
     """Prepares portfolio data and returns them as pandas dataset"""
-    dataset = pd.read_csv(settings.PORTFOLIO_PATH, sep=" ")
-    dataset["DATE"] = pd.to_datetime(dataset["DATE"], format="%d/%m/%y")
-    return dataset
+    return storage.read_portfolio_frame(settings.PORTFOLIO_PATH)
 
 
-def get_plot_html(dataset: Any) -> Any:
-    """Exports plot as HTML and returns it."""
-    # Create figure with secondary y-axis
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
+def get_plotly_js_name() -> str:
+    """Returns file name of the plotly.js bundle of the installed plotly version."""
+    import plotly  # pylint: disable=import-outside-toplevel
+
+    return f"plotly-{plotly.__version__}.min.js"
+
+
+def write_plotly_js(directory: Optional[pathlib.Path] = None) -> pathlib.Path:
+    """
+    Writes plotly.js bundle to the directory (default is the directory of
+    'settings.MAIN_CSS_FILE') if it isn't there yet and removes bundles of other
+    plotly versions. Returns path to the bundle.
+    """
+    from plotly.offline import get_plotlyjs  # pylint: disable=import-outside-toplevel
+
+    directory = directory if directory is not None else settings.MAIN_CSS_FILE.parent
+    path = directory / get_plotly_js_name()
+    if path.exists():
+        return path
+    os.makedirs(directory, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.part")
+    temp_path.write_text(get_plotlyjs(), encoding="utf-8")
+    os.replace(temp_path, path)
+    for old_path in directory.glob("plotly-*.min.js"):
+        if old_path != path:
+            old_path.unlink()
+    logging.debug("plotly.js written to %s", path)
+    return path
+
+
+def write_file_if_changed(path: pathlib.Path, content: bytes) -> bool:
+    """
+    Writes the content to the path unless the file already has the same content.
+    Returns True if the file was written.
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    if path.exists() and storage.file_digest(path) == digest:
+        logging.debug("File %s didn't change", path)
+        return False
+    os.makedirs(path.parent, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.part")
+    temp_path.write_bytes(content)
+    os.replace(temp_path, path)
+    return True
+
 
-    # Add traces
-    fig.add_trace(
-        go.Scatter(
-            x=dataset["DATE"], y=dataset["TOTAL_PRICE"], name="AKTUÁLNÍ HODNOTA"
-        ),
-        secondary_y=False,
+def get_fingerprint(value: Any) -> str:
+    """Returns SHA-256 hex digest of the JSON serializable value."""
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def _get_code_digests(modules: Sequence[str]) -> List[str]:
+    """Returns digests of the source files of the stock_summary modules."""
+    package_path = pathlib.Path(__file__).parent.resolve()
+    return [storage.file_digest(package_path / f"{module}.py") for module in modules]
+
+
+def get_portfolio_plot_html() -> str:
+    """
+    Returns plot of the portfolio. It's rendered again only if the portfolio file,
+    the plot settings or the plotting code changed since the last render.
+    """
+    fingerprint = get_fingerprint(
+        {
+            "portfolio": storage.file_digest(
+                storage.get_file_path(settings.PORTFOLIO_PATH)
+            ),
+            "code": _get_code_digests(PLOT_MODULES),
+            "plotly": get_plotly_js_name(),
+            "max_points": settings.PLOT_MAX_POINTS,
+            "webgl_points": settings.PLOT_WEBGL_POINTS,
+        }
     )
+    plot_html = cache.load_report("plot", fingerprint)
+    if plot_html is None:
+        plot_html = str(get_plot_html(prepare_portfolio_data()))
+        cache.save_report("plot", fingerprint, plot_html)
+    return plot_html
 
-    fig.add_trace(
-        go.Scatter(x=dataset["DATE"], y=dataset["PROFIT"], name="PROFIT"),
-        secondary_y=True,
+
+def get_report_fingerprint(snapshot: Optional[Snapshot] = None) -> str:
+    """
+    Returns fingerprint of all inputs of the HTML report: data files, times of the last
+    fetch of quotes and exchange rates (or the valuation snapshot if it's passed),
+    templates and the rendering code. Nothing is parsed or fetched.
+    """
+    return get_fingerprint(
+        {
+            "data": [
+                storage.file_digest(path)
+                for path in storage.get_data_paths()
+                if path.exists()
+            ],
+            "fetched_at": (
+                cache.load_fetch_times()
+                if snapshot is None
+                else {"snapshot": snapshot["created_at"]}
+            ),
+            "templates": [
+                storage.file_digest(path)
+                for path in sorted(settings.HTML_FILES_PATH.iterdir())
+            ],
+            "code": _get_code_digests(REPORT_MODULES),
+            "plotly": get_plotly_js_name(),
+            "max_points": settings.PLOT_MAX_POINTS,
+            "webgl_points": settings.PLOT_WEBGL_POINTS,
+        }
     )
 
+
+@profiling.profiled("render.plot")
+def get_plot_html(dataset: Any) -> Any:
+    """
+    Exports plot as HTML fragment and returns it. The fragment references plotly.js
+    bundle written by 'write_plotly_js' instead of inlining it. Series longer than
+    'settings.PLOT_MAX_POINTS' are downsampled by LTTB (0 turns it off). Series which
+    had more than 'settings.PLOT_WEBGL_POINTS' points before downsampling are rendered
+    by WebGL.
+    """
+    import plotly.graph_objects as go  # pylint: disable=import-outside-toplevel
+    from plotly.subplots import make_subplots  # pylint: disable=import-outside-toplevel
+
+    # pylint: disable-next=import-outside-toplevel
+    from stock_summary.downsampling import lttb_indices
+
+    # Create figure with secondary y-axis
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+    timestamps = dataset["DATE"].to_numpy(dtype="datetime64[ns]").astype("int64")
+    # Days and rounded values keep the embedded figure data compact
+    dates = dataset["DATE"].dt.strftime("%Y-%m-%d").to_numpy()
+    for column, name, secondary_y in (
+        ("TOTAL_PRICE", "AKTUÁLNÍ HODNOTA", False),
+        ("PROFIT", "PROFIT", True),
+    ):
+        values = dataset[column].round(2).to_numpy()
+        indices = lttb_indices(timestamps, values, settings.PLOT_MAX_POINTS)
+        logging.debug("Plotting %s of %s points of %s", len(indices), len(values), name)
+        scatter = (
+            go.Scattergl if len(values) > settings.PLOT_WEBGL_POINTS else go.Scatter
+        )
+        fig.add_trace(
+            scatter(x=dates[indices], y=values[indices], name=name),
+            secondary_y=secondary_y,
+        )
+
     # Add figure title
     fig.update_layout(title_text="Přehled portfolia v čase")
 
@@ -147,7 +387,7 @@ def get_plot_html(dataset: Any) -> Any:
     # Set y-axes titles
     fig.update_yaxes(title_text="<b>AKTUÁLNÍ HODNOTA</b>", secondary_y=False)
     fig.update_yaxes(title_text="<b>PROFIT</b>", secondary_y=True)
-    return fig.to_html()
+    return fig.to_html(include_plotlyjs=get_plotly_js_name(), full_html=False)
 
 
 def rewrite_data_files(rewrite: bool = False) -> None:
@@ -171,6 +411,14 @@ def rewrite_data_files(rewrite: bool = False) -> None:
             settings.DIVIDEND_PATH,
         )
         logging.debug(f"Created init portfolio file {settings.DIVIDEND_PATH}")
+    if rewrite and storage.is_sqlite():
+        for data_path in (
+            settings.ENTRIES_PATH,
+            settings.PORTFOLIO_PATH,
+            settings.DIVIDEND_PATH,
+        ):
+            storage.replace_rows(data_path, data_path.name, [])
+        logging.debug(f"Cleared data in the ledger {settings.LEDGER_PATH}")
 
 
 def import_data(from_file: pathlib.Path, to_file: pathlib.Path) -> None:
@@ -178,7 +426,7 @@ def import_data(from_file: pathlib.Path, to_file: pathlib.Path) -> None:
     Imports data from entry file to target file. If target file already exists, then
     asks user for confirmation
     """
-    shutil.copy2(from_file.resolve(), to_file.resolve())
+    storage.import_text_file(from_file, to_file)
     logging.debug(
         f"Successfully moved data from {from_file.resolve()} to {to_file.resolve()}"
     )
@@ -190,29 +438,25 @@ def export_data(directory: pathlib.Path) -> None:
     """
     path = directory.resolve()
     os.makedirs(path, exist_ok=True)
-    shutil.copy2(
+    for data_path in (
         settings.ENTRIES_PATH,
-        f"{path.joinpath(settings.ENTRIES_PATH.parts[-1]).resolve()}",
-    )
-    shutil.copy2(
         settings.PORTFOLIO_PATH,
-        f"{path.joinpath(settings.PORTFOLIO_PATH.parts[-1]).resolve()}",
-    )
-    shutil.copy2(
         settings.DIVIDEND_PATH,
-        f"{path.joinpath(settings.DIVIDEND_PATH.parts[-1]).resolve()}",
-    )
+    ):
+        storage.export_text_file(
+            data_path, path.joinpath(data_path.parts[-1]).resolve()
+        )
 
 
 def save_dividend(date: datetime.datetime, stock: str, amount: float) -> None:
     """Saves dividend into the file"""
     currency = get_pair_prices({stock})[stock].currency
     converted_amount = convert_currency(date, currency, "CZK", amount)
-    with open(settings.DIVIDEND_PATH, "a", newline="", encoding="utf-8") as csvfile:
-        csv_writer = csv.writer(csvfile, delimiter=" ", quotechar="|")
-        csv_writer.writerow(
-            [date.strftime("%d/%m/%Y"), stock, amount, converted_amount]
-        )
+    storage.append_rows(
+        settings.DIVIDEND_PATH,
+        storage.DIVIDENDS,
+        [DividendRow(date.strftime("%d/%m/%Y"), stock, amount, converted_amount)],
+    )
     logging.debug(
         f"Dividend date: {date} stock: {stock} amount: {amount} "
         f"converted_amount: {converted_amount} saved to {settings.DIVIDEND_PATH}"
@@ -227,75 +471,255 @@ def convert_currency(
     return amount * exchange_rates[from_curr]
 
 
-def get_dividend_summary() -> Dict[str, Dividend]:
-    """Returns dividend summary"""
+def get_dividend_summary(ledger: Optional[Ledger] = None) -> Dict[str, Dividend]:
+    """
+    Returns dividend summary, dividends are taken from the ledger if it's passed.
+    Pairs without quote (e.g. delisted ones) have empty currency.
+    """
+    dividends = (
+        ledger.dividends
+        if ledger is not None
+        else storage.aggregate_dividends(settings.DIVIDEND_PATH)
+    )
     dividend_summary: Dict[str, Dividend] = {}
-    with open(settings.DIVIDEND_PATH, newline="", encoding="utf-8") as csvfile:
-        dividends = csv.reader(csvfile, delimiter=" ", quotechar="|")
-        next(dividends)
-        for dividend in dividends:
-            if dividend[1] not in dividend_summary:
-                dividend_summary[dividend[1]] = {
-                    "symbol": dividend[1],
-                    "value": 0,
-                    "converted_value": 0,
-                    "currency": "",
-                }
-            dividend_summary[dividend[1]]["value"] += float(dividend[2])
-            dividend_summary[dividend[1]]["converted_value"] += float(dividend[3])
+    for pair, dividend in dividends.items():
+        dividend_summary[pair] = {
+            "symbol": pair,
+            "value": dividend.amount,
+            "converted_value": dividend.converted_amount,
+            "currency": "",
+        }
     pair_prices = get_pair_prices(set(dividend_summary.keys()))
     for key, value in dividend_summary.items():
-        value["currency"] = pair_prices[key].currency
+        price = pair_prices.get(key)
+        if price is None:
+            logging.warning("No quote of the dividend pair %s, currency is unknown", key)
+        else:
+            value["currency"] = price.currency
     return dividend_summary
 
 
-def get_dividend_sum(dividend_path: pathlib.Path = settings.DIVIDEND_PATH) -> float:
+def get_dividend_sum(dividend_path: Optional[pathlib.Path] = None) -> float:
     """Returns sum of the all dividends."""
-    with open(dividend_path, newline="", encoding="utf-8") as csvfile:
-        dividend_lines = csv.reader(csvfile, delimiter=" ", quotechar="|")
-        next(dividend_lines)
-        sum_value = 0.0
-        for dividend in dividend_lines:
-            sum_value += float(dividend[3])
-    return sum_value
+    dividend_path = dividend_path if dividend_path is not None else settings.DIVIDEND_PATH
+    return Ledger({}, storage.aggregate_dividends(dividend_path)).dividend_sum
 
 
-def get_pairs(entries_path: pathlib.Path = settings.ENTRIES_PATH) -> Set[str]:
+def get_pairs(entries_path: Optional[pathlib.Path] = None) -> Set[str]:
     """Returns list of pairs."""
-    with open(entries_path, newline="", encoding="utf-8") as csvfile:
-        pair_lines = csv.reader(csvfile, delimiter=" ", quotechar="|")
-        next(pair_lines)
-        pairs = [pair[1].strip() for pair in pair_lines if pair]
-        logging.debug("Getting pairs %s", pairs)
-        return set(pairs)
+    entries_path = entries_path if entries_path is not None else settings.ENTRIES_PATH
+    pairs = set(storage.aggregate_entries(entries_path).keys())
+    logging.debug("Getting pairs %s", pairs)
+    return pairs
 
 
 def save_entry(
     date: str, stock: str, count: str, price: str, converted_amount: float
 ) -> None:
     """Save entries to CSV file."""
-    with open(settings.ENTRIES_PATH, "a", newline="", encoding="utf-8") as csvfile:
-        csv_writer = csv.writer(csvfile, delimiter=" ", quotechar="|")
-        csv_writer.writerow([date, stock, count, price, converted_amount])
+    storage.append_rows(
+        settings.ENTRIES_PATH,
+        storage.ENTRIES,
+        [EntryRow(date, stock, float(count), float(price), converted_amount)],
+    )
     logging.debug(
         f"Entry date: {date} stock: {stock} count: {count} "
         f"price: {price} saved to {settings.ENTRIES_PATH}"
     )
 
 
+def save_entries(entries: Sequence[EntryRow]) -> None:
+    """Saves all entries to the entries file in one write."""
+    storage.append_rows(settings.ENTRIES_PATH, storage.ENTRIES, entries)
+    logging.debug(f"{len(entries)} entries saved to {settings.ENTRIES_PATH}")
+
+
+def read_csv_records(
+    path: pathlib.Path, fields: Sequence[str]
+) -> List[Dict[str, str]]:
+    """
+    Reads records with the fields from the comma separated file with header. Names of
+    the columns are case insensitive, other columns are ignored. Raises ValueError if
+    some of the fields is missing. Values missing in short rows are empty.
+    """
+    with open(path, newline="", encoding="utf-8") as csvfile:
+        reader = csv.reader(csvfile)
+        header = [column.strip().lower() for column in next(reader, [])]
+        missing_fields = [field for field in fields if field not in header]
+        if missing_fields:
+            raise ValueError(f"File {path} is missing columns {missing_fields}")
+        indexes = [header.index(field) for field in fields]
+        records = [
+            {
+                field: row[index].strip() if index < len(row) else ""
+                for field, index in zip(fields, indexes)
+            }
+            for row in reader
+            if row
+        ]
+    logging.debug(f"Read {len(records)} records from {path}")
+    return records
+
+
+def get_dated_exchange_rates(
+    dates: Iterable[datetime.datetime], base_pair: str = "CZK"
+) -> Dict[datetime.datetime, Dict[str, float]]:
+    """
+    Returns exchange rates for each of the dates, every distinct date is fetched only
+    once. Dates are fetched concurrently.
+    """
+    distinct_dates = sorted(set(dates))
+    if not distinct_dates:
+        return {}
+    workers = min(max(settings.STOCK_PRICE_WORKERS, 1), len(distinct_dates))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        rates = executor.map(
+            lambda date: get_exchange_rates(date, base_pair), distinct_dates
+        )
+        return dict(zip(distinct_dates, rates))
+
+
+def _parse_record(
+    record: Mapping[str, str], number_fields: Sequence[str], kind: str
+) -> Tuple[datetime.datetime, List[float]]:
+    """
+    Returns date and numbers of the record with stock, date and the number fields.
+    Empty values are checked before the conversion. Raises ValueError with the record
+    if some of the values is missing, zero or invalid.
+    """
+    fields = ("stock", "date", *number_fields)
+    if any(not record.get(field) for field in fields):
+        raise ValueError(f"{kind} {dict(record)} is missing some of the values")
+    try:
+        date = validate_date(record["date"])
+        numbers = [float(record[field]) for field in number_fields]
+    except ValueError as err:
+        raise ValueError(f"{kind} {dict(record)} has invalid value: {err}") from err
+    if not all(numbers):
+        raise ValueError(f"{kind} {dict(record)} is missing some of the values")
+    return date, numbers
+
+
+def prepare_entries(records: Sequence[Mapping[str, str]]) -> List[EntryRow]:
+    """
+    Prepares entries from records with stock, date (DD/MM/YYYY), count and price.
+    Currencies of all stocks are looked up in one batch and amounts are converted
+    to CZK by rates of the entry dates. All records are validated before the lookups.
+    """
+    parsed = [_parse_record(record, ("count", "price"), "Entry") for record in records]
+    dates = [date for date, _ in parsed]
+    pairs = [record["stock"] for record in records]
+    pair_prices = get_pair_prices(set(pairs))
+    dated_rates = get_dated_exchange_rates(dates)
+    entries = []
+    for (date, (count, price)), pair in zip(parsed, pairs):
+        converted_amount = (
+            count * price * dated_rates[date][pair_prices[pair].currency]
+        )
+        entries.append(
+            EntryRow(date.strftime("%d/%m/%Y"), pair, count, price, converted_amount)
+        )
+    return entries
+
+
+def save_dividends(dividends: Sequence[DividendRow]) -> None:
+    """Saves all dividends to the dividends file in one write."""
+    storage.append_rows(settings.DIVIDEND_PATH, storage.DIVIDENDS, dividends)
+    logging.debug(f"{len(dividends)} dividends saved to {settings.DIVIDEND_PATH}")
+
+
+def prepare_dividends(records: Sequence[Mapping[str, str]]) -> List[DividendRow]:
+    """
+    Prepares dividends from records with stock, date (DD/MM/YYYY) and amount in
+    the stock currency. Dividends are grouped by the payment date, so rates of each
+    date are fetched once, and amounts are converted to CZK. All records are validated
+    before the lookups.
+    """
+    parsed = [_parse_record(record, ("amount",), "Dividend") for record in records]
+    dates = [date for date, _ in parsed]
+    pairs = [record["stock"] for record in records]
+    pair_prices = get_pair_prices(set(pairs))
+    dated_rates = get_dated_exchange_rates(dates)
+    dividends = []
+    for (date, (amount,)), pair in zip(parsed, pairs):
+        converted_amount = amount * dated_rates[date][pair_prices[pair].currency]
+        dividends.append(
+            DividendRow(date.strftime("%d/%m/%Y"), pair, amount, converted_amount)
+        )
+    return dividends
+
+
+def backfill_portfolio(date_from: datetime.datetime, date_to: datetime.datetime) -> int:
+    """
+    Adds portfolio records for business days between the dates which don't have any
+    record yet, days before the first entry are skipped. Holdings are replayed from
+    the entries and valued by historical close prices, which are fetched once per
+    pair, and by exchange rates fetched once per day. Returns number of added records.
+    """
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    # pylint: disable-next=import-outside-toplevel
+    from stock_summary.valuation import position_history, value_history
+
+    entries = storage.read_entries(settings.ENTRIES_PATH)
+    if not entries:
+        return 0
+    first_entry_date = min(validate_date(entry.date) for entry in entries)
+    portfolio = storage.read_portfolio(settings.PORTFOLIO_PATH)
+    recorded_days = {record.date for record in portfolio}
+    days = pd.DatetimeIndex(
+        [
+            day
+            for day in pd.bdate_range(max(date_from, first_entry_date), date_to)
+            if day.strftime("%d/%m/%y") not in recorded_days
+        ]
+    )
+    if days.empty:
+        return 0
+    positions = position_history(entries, days)
+    histories = get_price_histories(set(positions.columns))
+    exchange_rates = get_dated_exchange_rates(days.to_pydatetime())
+    history = value_history(
+        entries,
+        storage.read_dividends(settings.DIVIDEND_PATH),
+        histories,
+        exchange_rates,
+        positions,
+    )
+    records = portfolio + [
+        PortfolioRow(date.strftime("%d/%m/%y"), total_price, profit)
+        for date, total_price, profit in zip(
+            history["DATE"], history["TOTAL_PRICE"].tolist(), history["PROFIT"].tolist()
+        )
+    ]
+    records.sort(key=lambda record: datetime.datetime.strptime(record.date, "%d/%m/%y"))
+    storage.replace_rows(settings.PORTFOLIO_PATH, storage.PORTFOLIO, records)
+    logging.debug(f"Backfilled {len(history)} portfolio records")
+    return len(history)
+
+
 def save_variables_to_file(
     env_vars: Mapping[str, str],
     env_path: pathlib.Path = settings.ENV_VARIABLES,
 ) -> None:
     """
     Takes mapping with variables key=value and saves them to
-    the env_vars file. If the file doesn't exist, then creates
-    it.
-    """
-    if not os.path.exists(env_path):
-        with open(env_path, "wb") as _:
-            pass
-    env_file = dotenv.find_dotenv(str(env_path.resolve()))
-    for key, value in env_vars.items():
-        dotenv.set_key(env_file, key, value)
-    logging.debug("Successfully saved %s to the %s", env_vars, env_file)
+    the env_vars file. If the file or its directory doesn't exist,
+    then creates them. Variables are written to a copy of the file
+    which replaces it, so interrupted write keeps the original file.
+    """
+    import dotenv  # pylint: disable=import-outside-toplevel
+
+    os.makedirs(env_path.parent, exist_ok=True)
+    with storage.open_temp_file(env_path) as temp_file:
+        if env_path.exists():
+            with open(env_path, "rb") as env_file:
+                shutil.copyfileobj(env_file, temp_file)
+    try:
+        for key, value in env_vars.items():
+            dotenv.set_key(temp_file.name, key, value)
+        os.replace(temp_file.name, env_path)
+    except BaseException:
+        os.unlink(temp_file.name)
+        raise
+    logging.debug("Successfully saved %s to the %s", env_vars, env_path)
@@ -1,80 +1,147 @@
 """ Module with main functionality of the tool"""
-import csv
 import datetime
 import logging
 import os
 import platform
-import shutil
 import sys
 import webbrowser
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Literal, Optional, Annotated
+from typing import TYPE_CHECKING, Dict, Literal, Optional, Annotated, Set, Tuple
 import appeal
 
-import jinja2
-
 from stock_summary.clouds.logic import sync_files_down, sync_files_up
-from stock_summary.help_structures import CloudType
+from stock_summary.help_structures import CloudType, PortfolioRow, StorageType
 
 logging_level = os.environ.get("DEBUG_LEVEL")
 logging.basicConfig(level=logging_level if logging_level else "DEBUG")
-from stock_summary import settings
-from stock_summary.library import (
-    convert_currency,
-    export_data,
-    get_dividend_sum,
-    get_dividend_summary,
-    get_entries_summary,
-    get_exchange_rates,
-    get_pair_prices,
-    get_pairs,
-    get_plot_html,
-    import_data,
-    prepare_portfolio_data,
-    rewrite_data_files,
-    save_dividend,
-    save_entry,
-    save_variables_to_file,
-    validate_date,
-)
+from stock_summary import cache, profiling, settings, storage
+
+# Library and its heavy dependencies (pandas, plotly, requests, jinja2, Azure SDK)
+# are imported inside the commands which need them, so the CLI starts fast
+# pylint: disable=import-outside-toplevel
+if TYPE_CHECKING:
+    from stock_summary.ledger import Ledger
+    from stock_summary.validation import PairResponse
 
 app = appeal.Appeal()
 
 
+@app.global_command()
+def global_main(*, profile: str = "", cprofile: str = "") -> None:
+    """
+    --profile - write wall time, transferred bytes and calls of each stage as JSON
+                to the file (or set PROFILE_PATH)
+    --cprofile - dump cProfile stats of the whole command to the file
+                 (or set CPROFILE_PATH)
+
+    Commands:
+
+    [[commands]]
+    [[end]]
+    """
+    report_path = Path(profile) if profile else settings.PROFILE_PATH
+    cprofile_path = Path(cprofile) if cprofile else settings.CPROFILE_PATH
+    if report_path is None and cprofile_path is not None:
+        report_path = cprofile_path.with_suffix(".json")
+    if report_path is not None:
+        profiling.enable(report_path, cprofile_path)
+
+
+def prefetch(
+    ledger: "Ledger", dividend_pairs: bool = False
+) -> Tuple[Dict[str, float], Dict[str, "PairResponse"]]:
+    """
+    Concurrently fetches actual exchange rates and prices of the pairs from the ledger,
+    prices of the pairs from dividends too if dividend_pairs is set. Both are cached,
+    so functions which need them later don't wait for the network again.
+    """
+    from stock_summary.library import get_exchange_rates, get_pair_prices
+
+    pairs = ledger.pairs | ledger.dividend_pairs if dividend_pairs else ledger.pairs
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        rates_future = executor.submit(get_exchange_rates)
+        prices_future = executor.submit(get_pair_prices, pairs)
+        return rates_future.result(), prices_future.result()
+
+
+def sync_down_and_prefetch(
+    dividend_pairs: bool = False,
+) -> Tuple["Ledger", Dict[str, float], Dict[str, "PairResponse"]]:
+    """
+    Syncs files down from the cloud and concurrently fetches actual exchange rates and
+    prices of the pairs from the local ledger. The local ledger is used further if the
+    sync didn't change any file, otherwise it's loaded again and pairs which appear
+    only in the synced ledger are fetched afterwards. Prices of the pairs from dividends
+    are fetched too if dividend_pairs is set. Returns synced ledger, exchange rates and
+    prices.
+    """
+    from stock_summary.ledger import Ledger
+    from stock_summary.library import get_exchange_rates, get_pair_prices
+
+    def get_ledger_pairs(ledger: Ledger) -> Set[str]:
+        return ledger.pairs | ledger.dividend_pairs if dividend_pairs else ledger.pairs
+
+    local_ledger: Optional[Ledger]
+    try:
+        local_ledger = Ledger.load()
+    except FileNotFoundError:
+        local_ledger = None
+    local_pairs = get_ledger_pairs(local_ledger) if local_ledger is not None else set()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        sync_future = executor.submit(sync_files_down)
+        rates_future = executor.submit(get_exchange_rates)
+        prices_future = executor.submit(get_pair_prices, local_pairs)
+        sync_stats = sync_future.result()
+        conversion_rates = rates_future.result()
+        prices = prices_future.result()
+    if local_ledger is not None and not any(stats.transferred for stats in sync_stats):
+        ledger = local_ledger
+    else:
+        ledger = Ledger.load()
+    missing_pairs = get_ledger_pairs(ledger) - set(prices.keys())
+    if missing_pairs:
+        logging.debug(
+            "Fetching prices of pairs from the synced ledger %s", missing_pairs
+        )
+        prices.update(get_pair_prices(missing_pairs))
+    return ledger, conversion_rates, prices
+
+
 @app.command("generate-portfolio")
 def generate_portfolio_main() -> None:
     """
     generates actual value of your portfolio in CZK and
     percentage move from the start of your investments
     """
-    sync_files_down()
-    conversion_rates = get_exchange_rates()
-    pairs = get_pairs()
-    prices = get_pair_prices(pairs)
-    with open(settings.ENTRIES_PATH, newline="", encoding="utf-8") as csvfile:
-        entries_reader = csv.reader(csvfile, delimiter=" ", quotechar="|")
-        init_value: float = 0
-        curr_value: float = 0
-        next(entries_reader)
-        stock_dict = defaultdict(int)
-        for row in entries_reader:
-            if not row:
-                continue
-            count = float(row[2])
-            init_value += float(row[4])
-            stock_dict[row[1]] += count
-            logging.info(stock_dict)
-        for stock_tag, count in stock_dict.items():
-            if count != 0:
-                conversion_rate = conversion_rates[prices[stock_tag].currency]
-                curr_value += count * prices[stock_tag].regularMarketPrice * conversion_rate
-    with open(settings.PORTFOLIO_PATH, "a", encoding="utf-8") as result_file:
-        now = datetime.datetime.now()
-        result_file.write(
-            f"{now.strftime('%d/%m/%y')} {curr_value} "
-            f"{curr_value - init_value + get_dividend_sum()}\n"
-        )
+    from stock_summary.library import get_dividend_summary
+    from stock_summary.snapshot import save_snapshot
+    from stock_summary.valuation import to_summary, value_holdings
+
+    ledger, conversion_rates, prices = sync_down_and_prefetch(dividend_pairs=True)
+    init_value = ledger.cost_basis
+    logging.info(ledger.holdings)
+    valuation = value_holdings(ledger.holdings, prices, conversion_rates)
+    curr_value = float(valuation["actual_basis"].sum())
+    now = datetime.datetime.now()
+    storage.append_rows(
+        settings.PORTFOLIO_PATH,
+        storage.PORTFOLIO,
+        [
+            PortfolioRow(
+                now.strftime("%d/%m/%y"),
+                curr_value,
+                curr_value - init_value + ledger.dividend_sum,
+            )
+        ],
+    )
+    # generate-html renders from the snapshot while it's fresh
+    save_snapshot(
+        to_summary(valuation),
+        get_dividend_summary(ledger=ledger),
+        conversion_rates,
+        prices,
+    )
     sync_files_up(paths=[settings.PORTFOLIO_PATH])
     logging.info(
         "Portfolio with cost basis %s and profit %s generated and added.",
@@ -83,34 +150,109 @@ def generate_portfolio_main() -> None:
     )
 
 
+@app.command("backfill-portfolio")
+@app.option("date_from", "--from", annotation=str)
+@app.option("date_to", "--to", annotation=str)
+def backfill_portfolio_main(*, date_from: str = "", date_to: str = "") -> None:
+    """
+    backfills your portfolio with values from the past by historical prices,
+    only business days without any portfolio record are added
+
+    --from - first date of the backfill, please add as DD/MM/YYYY
+    --to - last date of the backfill, please add as DD/MM/YYYY (default is yesterday)
+    """
+    from stock_summary.library import backfill_portfolio, validate_date
+
+    if not date_from:
+        logging.error("You have to enter the first date of the backfill.")
+        sys.exit(1)
+    date_from_datetime = validate_date(date_from)
+    date_to_datetime = (
+        validate_date(date_to)
+        if date_to
+        else datetime.datetime.combine(
+            datetime.date.today() - datetime.timedelta(days=1), datetime.time()
+        )
+    )
+    sync_files_down()
+    added = backfill_portfolio(date_from_datetime, date_to_datetime)
+    if added:
+        sync_files_up(paths=[settings.PORTFOLIO_PATH])
+    logging.info(
+        "Portfolio backfilled with %s records from %s to %s.",
+        added,
+        date_from_datetime.strftime("%d/%m/%Y"),
+        date_to_datetime.strftime("%d/%m/%Y"),
+    )
+
+
 @app.command("generate-html")
 def generate_html_main() -> None:
     """
     generates summary page from all current data
     """
-    sync_files_down()
-    summary_records = list(get_entries_summary().values())
-    dividend_summary = list(get_dividend_summary().values())
-
-    portfolio_data = prepare_portfolio_data()
-    plot_html = get_plot_html(portfolio_data)
-    environment = jinja2.Environment()
-    with open(
-            Path(__file__).parent.resolve() / "html_files" / "jinja.html",
-            "r",
-            encoding="utf-8",
-    ) as html_template:
-        template = environment.from_string(html_template.read())
-    with open(settings.INDEX_HTML_FILE, "w", encoding="utf-8") as index_file:
-        index_file.write(
-            template.render(
+    import jinja2
+
+    from stock_summary.ledger import Ledger
+    from stock_summary.library import (
+        get_dividend_summary,
+        get_entries_summary,
+        get_portfolio_plot_html,
+        get_report_fingerprint,
+        write_file_if_changed,
+        write_plotly_js,
+    )
+    from stock_summary.snapshot import load_snapshot
+
+    # Snapshot and the page are checked against the synced files. Prices are fetched
+    # speculatively during the sync, so a miss doesn't wait for the network again
+    ledger: Optional[Ledger] = None
+    if settings.CLOUD_TYPE is not CloudType.NONE:
+        ledger, _, _ = sync_down_and_prefetch(dividend_pairs=True)
+    # Fresh snapshot from generate-portfolio is used without API calls and ledger
+    snapshot = load_snapshot()
+    if snapshot is not None:
+        logging.info("Using valuation snapshot from generate-portfolio")
+    # The page is rendered again only if some of its inputs changed or its prices
+    # and exchange rates would be fetched again
+    index_html = cache.load_report(
+        "index",
+        get_report_fingerprint(snapshot),
+        max_age=(
+            min(settings.QUOTE_TTL, settings.EXCHANGE_RATE_TTL)
+            if snapshot is None
+            else None
+        ),
+    )
+    if index_html is None:
+        if snapshot is not None:
+            summary_records = list(snapshot["summary"].values())
+            dividend_summary = list(snapshot["dividends"].values())
+        else:
+            if ledger is None:
+                ledger = Ledger.load()
+                prefetch(ledger, dividend_pairs=True)
+            summary_records = list(get_entries_summary(ledger=ledger).values())
+            dividend_summary = list(get_dividend_summary(ledger=ledger).values())
+        plot_html = get_portfolio_plot_html()
+        with profiling.stage("render.template"):
+            environment = jinja2.Environment()
+            with open(
+                settings.HTML_FILES_PATH / "jinja.html", "r", encoding="utf-8"
+            ) as html_template:
+                template = environment.from_string(html_template.read())
+            index_html = template.render(
                 plot_html=plot_html, records=summary_records, dividends=dividend_summary
             )
-        )
-    shutil.copy2(
-        Path(__file__).parent.resolve() / "html_files" / "main.css",
-        settings.MAIN_CSS_FILE,
+        # Fetched prices and exchange rates are part of the fingerprint
+        cache.save_report("index", get_report_fingerprint(snapshot), index_html)
+    else:
+        logging.info("Report inputs didn't change, using the cached page")
+    write_file_if_changed(settings.INDEX_HTML_FILE, index_html.encode("utf-8"))
+    write_file_if_changed(
+        settings.MAIN_CSS_FILE, (settings.HTML_FILES_PATH / "main.css").read_bytes()
     )
+    write_plotly_js()
     logging.info(f"Index html file successfully saved to {settings.INDEX_HTML_FILE}")
     prepend_str = ""
     if platform.system().lower() == "darwin":
@@ -129,6 +271,12 @@ def add_entry_main(stock: str, date: str, count: float, price: float) -> None:
     count - count of stocks
     price - price of one stock
     """
+    from stock_summary.library import (
+        convert_currency,
+        get_pair_prices,
+        save_entry,
+        validate_date,
+    )
 
     sync_files_down()
     if not stock or not date or not count or not price:
@@ -139,7 +287,7 @@ def add_entry_main(stock: str, date: str, count: float, price: float) -> None:
         date_datetime: datetime.datetime = validate_date(date)
     except TypeError as err:
         raise RuntimeError("parameters have bad types, please try again") from err
-    currency = get_pair_prices(get_pairs())[stock].currency
+    currency = get_pair_prices({pair})[pair].currency
     converted_amount = convert_currency(date_datetime, currency, "CZK", count * price)
     save_entry(date, pair, count, price, converted_amount)
     logging.info(
@@ -152,6 +300,27 @@ def add_entry_main(stock: str, date: str, count: float, price: float) -> None:
     sync_files_up(paths=[settings.ENTRIES_PATH])
 
 
+@app.command("add-entries")
+def add_entries_main(path: str) -> None:
+    """
+    add entries from the CSV file, e.g. with fills from your broker
+
+    path - path to the comma separated file with header and columns stock,
+           date (DD/MM/YYYY), count and price
+    """
+    from stock_summary.library import prepare_entries, read_csv_records, save_entries
+
+    records = read_csv_records(Path(path), ["stock", "date", "count", "price"])
+    if not records:
+        logging.error("No entries found in the file %s.", path)
+        sys.exit(1)
+    sync_files_down()
+    entries = prepare_entries(records)
+    save_entries(entries)
+    logging.info("%s entries from %s successfully added.", len(entries), path)
+    sync_files_up(paths=[settings.ENTRIES_PATH])
+
+
 @app.command("export-data")
 def export_data_main(directory: str) -> None:
     """
@@ -159,6 +328,8 @@ def export_data_main(directory: str) -> None:
 
     directory - path to directory for export
     """
+    from stock_summary.library import export_data
+
     sync_files_down()
     if not directory:
         logging.error("You need to pass the directory for the output.")
@@ -170,7 +341,7 @@ def export_data_main(directory: str) -> None:
 def import_data_main(*, entries: Annotated[Optional[str], None] = None,
                      portfolio: Annotated[Optional[str], None] = None,
                      dividends: Annotated[Optional[str], None] = None,
-                     initialize= False, confirmation = False) -> None:
+                     initialize= False, confirmation = False, migrate = False) -> None:
     """
     imports data from your custom files
 
@@ -179,7 +350,26 @@ def import_data_main(*, entries: Annotated[Optional[str], None] = None,
     --dividends - Path to your dividends file
     --initialize - Flag for initialization of basic data false, has to be used with -y, or it has no effect.
     --confirmation -  Flag to automatically confirm all actions as overwrite of your current datafiles
+    --migrate - Flag to migrate your current text data files to the SQLite ledger
+                and use it from now on
     """
+    from stock_summary.library import (
+        import_data,
+        rewrite_data_files,
+        save_variables_to_file,
+    )
+
+    if migrate:
+        if portfolio or entries or dividends or initialize:
+            logging.error("Migration can't be combined with other options.")
+            sys.exit(1)
+        sync_files_down()
+        storage.migrate_to_sqlite()
+        save_variables_to_file({"STORAGE_TYPE": StorageType.SQLITE.value})
+        settings.STORAGE_TYPE = StorageType.SQLITE
+        logging.info(f"Data files successfully migrated to {settings.LEDGER_PATH}")
+        sync_files_up()
+        return
     if (
             portfolio or entries or dividends
     ) and initialize:
@@ -239,6 +429,8 @@ def add_dividend_main(date: str, stock: str, amount: float) -> None:
     stock - Symbol of the stock for dividend.
     amount - Amount of the earned money (in stock currency)
     """
+    from stock_summary.library import save_dividend, validate_date
+
     if not stock or not date or not amount:
         logging.error("You have to enter all needed params")
         raise ValueError("You have to enter all needed params")
@@ -258,25 +450,65 @@ def add_dividend_main(date: str, stock: str, amount: float) -> None:
     )
 
 
+@app.command("add-dividends")
+def add_dividends_main(path: str) -> None:
+    """
+    add dividends from the CSV file, e.g. with statements from your broker
+
+    path - path to the comma separated file with header and columns stock,
+           date (DD/MM/YYYY) and amount (in stock currency)
+    """
+    from stock_summary.library import (
+        prepare_dividends,
+        read_csv_records,
+        save_dividends,
+    )
+
+    records = read_csv_records(Path(path), ["stock", "date", "amount"])
+    if not records:
+        logging.error("No dividends found in the file %s.", path)
+        sys.exit(1)
+    sync_files_down()
+    dividends = prepare_dividends(records)
+    save_dividends(dividends)
+    sync_files_up(paths=[settings.DIVIDEND_PATH])
+    logging.info("%s dividends from %s successfully added.", len(dividends), path)
+
+
 @app.command("set-cloud")
 @app.option("tactic", "--local-tactic", annotation=lambda: "local")
 @app.option("tactic", "--cloud-tactic", annotation=lambda: "cloud")
-def set_cloud_main(cloud: Annotated[Literal["none", "azure"], appeal.validate('none', 'azure')],
-                   azure: Annotated[Optional[str], None] = None, *,
-                   tactic: str = "local") -> None:
+@app.option("path", "--path", annotation=str)
+def set_cloud_main(
+    cloud: Annotated[
+        Literal["none", "azure", "local"], appeal.validate("none", "azure", "local")
+    ],
+    azure: Annotated[Optional[str], None] = None,
+    *,
+    tactic: str = "local",
+    path: str = "",
+) -> None:
     """
     Set up your cloud environment and sync data with it
 
-    cloud - type of the cloud to use (now supported 'none'(default, only local files) and 'azure')"
+    cloud - type of the cloud to use (now supported 'none'(default, only local
+            files), 'azure' and 'local')
     --cloud-tactic - use cloud files for sync and rewrite local ones (default one)
     --local-tactic - use local files for sync and rewrite cloud ones
     azure - connection string to the azure
+    --path - directory or mounted network drive used by the 'local' cloud
     """
+    from stock_summary.library import save_variables_to_file
+
     env_vars: Dict[str, str] = {}
     if azure is not None:
         env_vars["AZURE_CONNECTION_STR"] = azure
         settings.AZURE_CONNECTION_STR = azure
         logging.info("Azure connection string parsed correctly.")
+    if path:
+        env_vars["LOCAL_CLOUD_PATH"] = str(Path(path).resolve())
+        settings.LOCAL_CLOUD_PATH = Path(path).resolve()
+        logging.info("Local cloud path parsed correctly.")
     try:
         if cloud is not None:
             cloud_enum = CloudType(cloud.lower())
@@ -0,0 +1,146 @@
+""" Per-stage timing of the commands with JSON output """
+import atexit
+import cProfile
+import functools
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar, cast
+
+_FunctionT = TypeVar("_FunctionT", bound=Callable[..., Any])
+
+
+
+class _Recording:
+    """State of the recording of the stages in this process."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.started_at: Optional[float] = None
+        self.report_path: Optional[pathlib.Path] = None
+        self.profiler: Optional[cProfile.Profile] = None
+        self.cprofile_path: Optional[pathlib.Path] = None
+
+    def add(self, name: str, duration: float, transferred: int) -> None:
+        """Adds one call of the stage to its stats."""
+        with self.lock:
+            stage_stats = self.stages.setdefault(
+                name, {"calls": 0, "seconds": 0.0, "bytes": 0}
+            )
+            stage_stats["calls"] += 1
+            stage_stats["seconds"] += duration
+            stage_stats["bytes"] += transferred
+
+    def get_stages(self) -> Dict[str, Dict[str, float]]:
+        """Returns copy of the stats of all recorded stages."""
+        with self.lock:
+            return {
+                name: dict(stage_stats) for name, stage_stats in self.stages.items()
+            }
+
+
+_recording = _Recording()
+
+
+class StageRecord:
+    """Record of one run of the stage, transferred bytes can be added to it."""
+
+    def __init__(self) -> None:
+        self.transferred = 0
+
+    def add_bytes(self, transferred: int) -> None:
+        """Adds transferred bytes to the record."""
+        self.transferred += transferred
+
+
+def is_enabled() -> bool:
+    """Returns True if the stages are recorded."""
+    return _recording.report_path is not None
+
+
+def enable(
+    report_path: pathlib.Path, cprofile_path: Optional[pathlib.Path] = None
+) -> None:
+    """
+    Starts recording of the stages, the report is written to the report path when
+    the process exits. If cprofile path is set, cProfile stats are dumped there too.
+    """
+    with _recording.lock:
+        _recording.stages.clear()
+    _recording.started_at = time.perf_counter()
+    _recording.report_path = report_path
+    _recording.cprofile_path = cprofile_path
+    if cprofile_path is not None:
+        _recording.profiler = cProfile.Profile()
+        _recording.profiler.enable()
+    atexit.register(write_report)
+    logging.debug("Profiling enabled, report will be written to %s", report_path)
+
+
+def record(name: str, duration: float, transferred: int = 0) -> None:
+    """Adds one call of the stage with its duration and transferred bytes."""
+    if not is_enabled():
+        return
+    _recording.add(name, duration, transferred)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[StageRecord]:
+    """Measures wall time of the block as one call of the stage."""
+    stage_record = StageRecord()
+    start = time.perf_counter()
+    try:
+        yield stage_record
+    finally:
+        record(name, time.perf_counter() - start, stage_record.transferred)
+
+
+def profiled(name: str) -> Callable[[_FunctionT], _FunctionT]:
+    """Decorator which measures each call of the function as the stage."""
+
+    def decorator(function: _FunctionT) -> _FunctionT:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return cast(_FunctionT, wrapper)
+
+    return decorator
+
+
+def get_report() -> Dict[str, Any]:
+    """Returns total wall time and stats of all recorded stages."""
+    started_at = _recording.started_at
+    return {
+        "total_seconds": (
+            time.perf_counter() - started_at if started_at is not None else 0.0
+        ),
+        "stages": _recording.get_stages(),
+    }
+
+
+def write_report() -> None:
+    """
+    Writes the report as JSON, dumps cProfile stats if they are recorded and stops
+    the recording.
+    """
+    report_path = _recording.report_path
+    if report_path is None:
+        return
+    atexit.unregister(write_report)
+    profiler, cprofile_path = _recording.profiler, _recording.cprofile_path
+    if profiler is not None and cprofile_path is not None:
+        profiler.disable()
+        profiler.dump_stats(os.fspath(cprofile_path))
+        _recording.profiler = None
+        logging.info("cProfile stats written to %s", cprofile_path)
+    _recording.report_path = None
+    with open(report_path, "w", encoding="utf-8") as report_file:
+        json.dump(get_report(), report_file, indent=2)
+    logging.info("Profile report written to %s", report_path)
@@ -2,17 +2,22 @@
 import logging
 import os
 import pathlib
+import sys
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
 
 import appdirs
-from dotenv import load_dotenv
 
-from stock_summary.help_structures import CloudType
+from stock_summary.help_structures import CloudCompression, CloudType, StorageType
 
 DATA_PATH = pathlib.Path(appdirs.user_data_dir("stock_summary")).resolve()
 SETTINGS_PATH = pathlib.Path(appdirs.user_config_dir("stock_summary")).resolve()
 INIT_DATASETS_PATH = (
     pathlib.Path(__file__).parent.resolve().joinpath("init_datasets").resolve()
 )
+HTML_FILES_PATH = (
+    pathlib.Path(__file__).parent.resolve().joinpath("html_files").resolve()
+)
 
 
 ENTRIES_PATH = DATA_PATH.joinpath("entries").resolve()
@@ -20,42 +25,170 @@ PORTFOLIO_PATH = DATA_PATH.joinpath("portfolio").resolve()
 DIVIDEND_PATH = DATA_PATH.joinpath("dividends").resolve()
 INDEX_HTML_FILE = DATA_PATH.joinpath("index.html").resolve()
 MAIN_CSS_FILE = DATA_PATH.joinpath("main.css").resolve()
+LEDGER_PATH = DATA_PATH.joinpath("ledger.sqlite").resolve()
+CACHE_PATH = DATA_PATH.joinpath("cache.sqlite").resolve()
+SNAPSHOT_PATH = DATA_PATH.joinpath("snapshot.json").resolve()
 TOKEN_PATH = SETTINGS_PATH.joinpath("token").resolve()
 ENV_VARIABLES = SETTINGS_PATH.joinpath(".env").resolve()
-try:
-    with open(TOKEN_PATH, "r", encoding="utf-8") as token_file:
-        API_TOKEN = token_file.read().strip()
-except FileNotFoundError:
-    API_TOKEN = ""
 
 EXCHANGE_RATE_URL = "https://currency-conversion-and-exchange-rates.p.rapidapi.com"
-EXCHANGE_RATE_HEADERS = {
-    "X-RapidAPI-Key": API_TOKEN,
-    "X-RapidAPI-Host": "currency-conversion-and-exchange-rates.p.rapidapi.com",
-}
-
 STOCK_PRICE_URL = "https://yahoo-finance15.p.rapidapi.com/api/yahoo/qu/quote"
-STOCK_PRICE_HEADERS = {
-    "X-RapidAPI-Key": API_TOKEN,
-    "X-RapidAPI-Host": "yahoo-finance15.p.rapidapi.com",
-}
+STOCK_HISTORY_URL = "https://yahoo-finance15.p.rapidapi.com/api/yahoo/hi/history"
 
+# Settings below are resolved from the token file and the environment on the first
+# access, so importing the settings doesn't touch the disk. They can be overridden
+# by assignment as any other module attribute.
+API_TOKEN: str
+EXCHANGE_RATE_HEADERS: Dict[str, str]
+STOCK_PRICE_HEADERS: Dict[str, str]
 
 # Cloud variables
-load_dotenv(ENV_VARIABLES)
-
-try:
-    CLOUD_TYPE = (
-        CloudType(os.environ["CLOUD_TYPE"])
-        if os.environ.get("CLOUD_TYPE") is not None
-        else CloudType.NONE
-    )
-except ValueError:
-    logging.warning("Invalid value '%s' of the cloud type.", os.environ["CLOUD_TYPE"])
-    CLOUD_TYPE = CloudType.NONE
-AZURE_CONNECTION_STR = (
-    os.environ["AZURE_CONNECTION_STR"]
-    if os.environ.get("AZURE_CONNECTION_STR") is not None
-    and os.environ.get("AZURE_CONNECTION_STR") != ""
-    else None
-)
+CLOUD_TYPE: CloudType
+AZURE_CONNECTION_STR: Optional[str]
+LOCAL_CLOUD_PATH: Optional[pathlib.Path]
+CLOUD_COMPRESSION: CloudCompression
+
+# Storage variables
+STORAGE_TYPE: StorageType
+
+# Cache variables
+EXCHANGE_RATE_TTL: float
+QUOTE_TTL: float
+SNAPSHOT_TTL: float
+
+# API variables
+STOCK_PRICE_CHUNK_SIZE: int
+STOCK_PRICE_WORKERS: int
+
+# Cloud sync variables
+CLOUD_SYNC_WORKERS: int
+
+# Plot variables
+PLOT_MAX_POINTS: int
+PLOT_WEBGL_POINTS: int
+
+# Profiling variables
+PROFILE_PATH: Optional[pathlib.Path]
+CPROFILE_PATH: Optional[pathlib.Path]
+
+
+@lru_cache()
+def _load_environment() -> None:
+    """Loads variables from the .env file in the settings directory, only once."""
+    from dotenv import load_dotenv  # pylint: disable=import-outside-toplevel
+
+    load_dotenv(ENV_VARIABLES)
+
+
+def _get_api_token() -> str:
+    """Returns token to the rapidAPI from the token file or empty string."""
+    try:
+        with open(TOKEN_PATH, "r", encoding="utf-8") as token_file:
+            return token_file.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def _get_headers(host: str) -> Dict[str, str]:
+    """Returns headers of the requests to the rapidAPI host."""
+    # Attribute access resolves the token lazily or takes the overridden one
+    api_token: str = sys.modules[__name__].API_TOKEN
+    return {"X-RapidAPI-Key": api_token, "X-RapidAPI-Host": host}
+
+
+def _get_string(name: str) -> Optional[str]:
+    """Returns value of the environment variable or None if it isn't set or is empty."""
+    value = os.environ.get(name)
+    return value if value else None
+
+
+def _get_path(name: str) -> Optional[pathlib.Path]:
+    """Returns path from the environment variable or None if it isn't set."""
+    value = _get_string(name)
+    return pathlib.Path(value) if value is not None else None
+
+
+def _get_number(name: str, default: float) -> float:
+    """Returns number from the environment variable or default if it's not valid."""
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        logging.warning("Invalid value '%s' of the %s.", os.environ[name], name)
+        return default
+
+
+def _get_cloud_type() -> CloudType:
+    """Returns type of the cloud from the environment, invalid value turns it off."""
+    try:
+        return (
+            CloudType(os.environ["CLOUD_TYPE"])
+            if os.environ.get("CLOUD_TYPE") is not None
+            else CloudType.NONE
+        )
+    except ValueError:
+        logging.warning(
+            "Invalid value '%s' of the cloud type.", os.environ["CLOUD_TYPE"]
+        )
+        return CloudType.NONE
+
+
+def _get_cloud_compression() -> CloudCompression:
+    """Returns compression of the cloud files from the environment."""
+    try:
+        return CloudCompression(
+            os.environ.get("CLOUD_COMPRESSION", CloudCompression.NONE.value)
+        )
+    except ValueError:
+        logging.warning(
+            "Invalid value '%s' of the cloud compression.",
+            os.environ["CLOUD_COMPRESSION"],
+        )
+        return CloudCompression.NONE
+
+
+def _get_storage_type() -> StorageType:
+    """Returns type of the storage for data files from the environment."""
+    try:
+        return StorageType(os.environ.get("STORAGE_TYPE", StorageType.TEXT.value))
+    except ValueError:
+        logging.warning(
+            "Invalid value '%s' of the storage type.", os.environ["STORAGE_TYPE"]
+        )
+        return StorageType.TEXT
+
+
+_LAZY_SETTINGS: Dict[str, Callable[[], Any]] = {
+    "API_TOKEN": _get_api_token,
+    "EXCHANGE_RATE_HEADERS": lambda: _get_headers(
+        "currency-conversion-and-exchange-rates.p.rapidapi.com"
+    ),
+    "STOCK_PRICE_HEADERS": lambda: _get_headers("yahoo-finance15.p.rapidapi.com"),
+    "CLOUD_TYPE": _get_cloud_type,
+    "AZURE_CONNECTION_STR": lambda: _get_string("AZURE_CONNECTION_STR"),
+    "LOCAL_CLOUD_PATH": lambda: _get_path("LOCAL_CLOUD_PATH"),
+    "CLOUD_COMPRESSION": _get_cloud_compression,
+    "STORAGE_TYPE": _get_storage_type,
+    "EXCHANGE_RATE_TTL": lambda: _get_number("EXCHANGE_RATE_TTL", 3600),
+    "QUOTE_TTL": lambda: _get_number("QUOTE_TTL", 300),
+    "SNAPSHOT_TTL": lambda: _get_number("SNAPSHOT_TTL", 3600),
+    "STOCK_PRICE_CHUNK_SIZE": lambda: int(_get_number("STOCK_PRICE_CHUNK_SIZE", 50)),
+    "STOCK_PRICE_WORKERS": lambda: int(_get_number("STOCK_PRICE_WORKERS", 4)),
+    "CLOUD_SYNC_WORKERS": lambda: int(_get_number("CLOUD_SYNC_WORKERS", 4)),
+    "PLOT_MAX_POINTS": lambda: int(_get_number("PLOT_MAX_POINTS", 2000)),
+    "PLOT_WEBGL_POINTS": lambda: int(_get_number("PLOT_WEBGL_POINTS", 5000)),
+    "PROFILE_PATH": lambda: _get_path("PROFILE_PATH"),
+    "CPROFILE_PATH": lambda: _get_path("CPROFILE_PATH"),
+}
+
+
+def __getattr__(name: str) -> Any:
+    """Resolves the lazy setting on the first access and keeps its value."""
+    try:
+        get_setting = _LAZY_SETTINGS[name]
+    except KeyError:
+        err_msg = f"module {__name__!r} has no attribute {name!r}"
+        raise AttributeError(err_msg) from None
+    _load_environment()
+    value = get_setting()
+    globals()[name] = value
+    return value
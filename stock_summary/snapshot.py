@@ -0,0 +1,98 @@
+""" Valuation snapshot saved by generate-portfolio and reused by generate-html """
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from stock_summary import settings, storage
+from stock_summary.help_structures import Dividend, Snapshot, SummaryDict
+from stock_summary.validation import PairResponse
+
+
+def _get_price_values(prices: Dict[str, PairResponse]) -> Dict[str, Dict[str, Any]]:
+    """Returns JSON serializable values of the prices."""
+    return {symbol: price.dict(exclude={"pairs"}) for symbol, price in prices.items()}
+
+
+def _get_data_digests() -> Dict[str, str]:
+    """Returns digests of the local files with entries and dividends."""
+    paths = {
+        storage.get_file_path(settings.ENTRIES_PATH),
+        storage.get_file_path(settings.DIVIDEND_PATH),
+    }
+    return {
+        str(path): storage.file_digest(path) if path.exists() else ""
+        for path in sorted(paths)
+    }
+
+
+def _is_valid(snapshot: Any) -> bool:
+    """Returns True if the loaded JSON has all keys of the snapshot with right types."""
+    return (
+        isinstance(snapshot, dict)
+        and isinstance(snapshot.get("created_at"), (int, float))
+        and all(
+            isinstance(snapshot.get(key), dict)
+            for key in (
+                "data_digests",
+                "exchange_rates",
+                "prices",
+                "summary",
+                "dividends",
+            )
+        )
+    )
+
+
+def save_snapshot(
+    summary: Dict[str, SummaryDict],
+    dividends: Dict[str, Dividend],
+    exchange_rates: Dict[str, float],
+    prices: Dict[str, PairResponse],
+) -> None:
+    """
+    Saves valuation of the holdings and dividends with prices and exchange rates it
+    was computed from to 'settings.SNAPSHOT_PATH'.
+    """
+    snapshot: Snapshot = {
+        "created_at": time.time(),
+        "data_digests": _get_data_digests(),
+        "exchange_rates": exchange_rates,
+        "prices": _get_price_values(prices),
+        "summary": summary,
+        "dividends": dividends,
+    }
+    os.makedirs(settings.SNAPSHOT_PATH.parent, exist_ok=True)
+    temp_path = settings.SNAPSHOT_PATH.with_name(f".{settings.SNAPSHOT_PATH.name}.part")
+    with open(temp_path, "w", encoding="utf-8") as snapshot_file:
+        json.dump(snapshot, snapshot_file)
+    os.replace(temp_path, settings.SNAPSHOT_PATH)
+    logging.debug("Valuation snapshot saved to %s", settings.SNAPSHOT_PATH)
+
+
+def load_snapshot(max_age: Optional[float] = None) -> Optional[Snapshot]:
+    """
+    Returns saved snapshot if it isn't older than max_age seconds (default is
+    'settings.SNAPSHOT_TTL') and entries and dividends didn't change since it was
+    saved, otherwise None. Malformed snapshot is treated as missing.
+    """
+    max_age = max_age if max_age is not None else settings.SNAPSHOT_TTL
+    try:
+        with open(settings.SNAPSHOT_PATH, "r", encoding="utf-8") as snapshot_file:
+            loaded = json.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        loaded = None
+    if not _is_valid(loaded):
+        logging.warning("Invalid valuation snapshot %s", settings.SNAPSHOT_PATH)
+        return None
+    snapshot: Snapshot = loaded
+    if time.time() - snapshot["created_at"] > max_age:
+        logging.debug("Valuation snapshot is stale")
+        return None
+    if snapshot["data_digests"] != _get_data_digests():
+        logging.debug("Data files changed since the valuation snapshot")
+        return None
+    return snapshot
@@ -0,0 +1,425 @@
+"""
+Storage of the data files. Data are saved either in the space-delimited text files
+(default) or in the SQLite ledger with typed columns, see 'settings.STORAGE_TYPE'.
+In the SQLite storage, each data file is saved in the table with the same name.
+"""
+import csv
+import hashlib
+import io
+import logging
+import os
+import pathlib
+import shutil
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from stock_summary import cache, profiling, settings
+from stock_summary.help_structures import (
+    DividendRow,
+    DividendTotal,
+    EntryRow,
+    Holding,
+    PortfolioRow,
+    StorageType,
+)
+
+ENTRIES = "entries"
+DIVIDENDS = "dividends"
+PORTFOLIO = "portfolio"
+
+# Columns of the data files with their types, names are same as headers of text files
+_COLUMNS: Dict[str, Tuple[Tuple[str, type], ...]] = {
+    ENTRIES: (
+        ("DATE", str),
+        ("PAIR", str),
+        ("COUNT", float),
+        ("PRICE", float),
+        ("CONVERTED_AMOUNT", float),
+    ),
+    DIVIDENDS: (
+        ("DATE", str),
+        ("PAIR", str),
+        ("AMOUNT", float),
+        ("CONVERTED_AMOUNT", float),
+    ),
+    PORTFOLIO: (("DATE", str), ("TOTAL_PRICE", float), ("PROFIT", float)),
+}
+_SQL_TYPES = {str: "TEXT", float: "REAL"}
+# Bigger chunks of the entries are parsed and grouped vectorized by pandas
+_VECTORIZED_PARSE_BYTES = 1024 * 1024
+
+
+def is_sqlite() -> bool:
+    """Returns True if data are saved in the SQLite ledger."""
+    return settings.STORAGE_TYPE == StorageType.SQLITE
+
+
+def get_data_paths() -> List[pathlib.Path]:
+    """Returns local paths of all files with data for the actual storage."""
+    if is_sqlite():
+        return [settings.LEDGER_PATH]
+    return [settings.ENTRIES_PATH, settings.DIVIDEND_PATH, settings.PORTFOLIO_PATH]
+
+
+def get_file_path(path: pathlib.Path) -> pathlib.Path:
+    """Returns local file where data of the data file path are saved."""
+    if is_sqlite() and path.name in _COLUMNS:
+        return settings.LEDGER_PATH
+    return path
+
+
+def open_temp_file(path: pathlib.Path) -> IO[bytes]:
+    """
+    Opens new temporary file next to the path for writing, so it can atomically replace
+    the path by 'os.replace'. The file gets mode of the existing file on the path, or
+    the default mode given by umask.
+    """
+    # The caller closes the file, it's used as the context manager there
+    # pylint: disable-next=consider-using-with
+    temp_file = open(path.with_name(f".{path.name}.{uuid.uuid4().hex}.part"), "xb")
+    if path.exists():
+        shutil.copymode(path, temp_file.name)
+    return temp_file
+
+
+def file_digest(path: pathlib.Path, size: Optional[int] = None) -> str:
+    """Returns SHA-256 hash of the file content, or of its first size bytes."""
+    digest = hashlib.sha256()
+    remaining = size
+    with open(path, "rb") as data_file:
+        while remaining is None or remaining > 0:
+            chunk = data_file.read(
+                1024 * 1024 if remaining is None else min(remaining, 1024 * 1024)
+            )
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def connect() -> Iterator[sqlite3.Connection]:
+    """
+    Yields connection to the SQLite ledger, creates tables if needed. Changes are
+    committed and the connection is closed on exit.
+    """
+    os.makedirs(settings.LEDGER_PATH.parent, exist_ok=True)
+    connection = sqlite3.connect(settings.LEDGER_PATH, timeout=10)
+    try:
+        for kind, columns in _COLUMNS.items():
+            column_defs = ", ".join(
+                f"{name} {_SQL_TYPES[column_type]} NOT NULL"
+                for name, column_type in columns
+            )
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {kind} ({column_defs})")
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def _insert_rows(
+    connection: sqlite3.Connection, kind: str, rows: Sequence[Sequence[Any]]
+) -> None:
+    """Inserts rows to the table of the data file kind."""
+    connection.executemany(
+        f"INSERT INTO {kind} VALUES ({', '.join('?' for _ in _COLUMNS[kind])})", rows
+    )
+
+
+def _replace_table(kind: str, rows: Sequence[Sequence[Any]]) -> None:
+    """Replaces all rows in the table of the data file kind."""
+    with connect() as connection:
+        connection.execute(f"DELETE FROM {kind}")
+        _insert_rows(connection, kind, rows)
+
+
+def read_text_rows(path: pathlib.Path, kind: str) -> List[Tuple[Any, ...]]:
+    """Reads typed rows of the data file kind from the text file, skips header."""
+    converters = [column_type for _, column_type in _COLUMNS[kind]]
+    with open(path, newline="", encoding="utf-8") as csvfile:
+        reader = csv.reader(csvfile, delimiter=" ", quotechar="|")
+        next(reader, None)
+        return [
+            tuple(converter(value.strip()) for converter, value in zip(converters, row))
+            for row in reader
+            if row
+        ]
+
+
+def _ends_with_line_break(path: pathlib.Path) -> bool:
+    """Returns True if the last byte of the file is line break."""
+    with open(path, "rb") as data_file:
+        data_file.seek(-1, os.SEEK_END)
+        return data_file.read(1) == b"\n"
+
+
+def write_text_rows(
+    path: pathlib.Path, kind: str, rows: Sequence[Sequence[Any]], append: bool = True
+) -> None:
+    """
+    Writes rows of the data file kind to the text file. If append is False, the file is
+    rewritten and starts with the header.
+    """
+    if not append:
+        cache.clear_checkpoint(str(path.resolve()))
+    with open(path, "a" if append else "w", newline="", encoding="utf-8") as csvfile:
+        if append and csvfile.tell() > 0 and not _ends_with_line_break(path):
+            csvfile.write("\r\n")
+        csv_writer = csv.writer(csvfile, delimiter=" ", quotechar="|")
+        if not append:
+            csv_writer.writerow([name for name, _ in _COLUMNS[kind]])
+        csv_writer.writerows(rows)
+
+
+def read_rows(path: pathlib.Path, kind: str) -> List[Tuple[Any, ...]]:
+    """
+    Reads typed rows of the data file kind. Path is used for the text storage,
+    SQLite storage reads the table of the kind.
+    """
+    if not is_sqlite():
+        return read_text_rows(path, kind)
+    columns = ", ".join(name for name, _ in _COLUMNS[kind])
+    with connect() as connection:
+        return connection.execute(
+            f"SELECT {columns} FROM {kind} ORDER BY rowid"
+        ).fetchall()
+
+
+def append_rows(path: pathlib.Path, kind: str, rows: Sequence[Sequence[Any]]) -> None:
+    """Appends rows to the data file kind in one write."""
+    if not is_sqlite():
+        write_text_rows(path, kind, rows)
+    else:
+        with connect() as connection:
+            _insert_rows(connection, kind, rows)
+    logging.debug("Appended %s rows to %s", len(rows), kind)
+
+
+def replace_rows(path: pathlib.Path, kind: str, rows: Sequence[Sequence[Any]]) -> None:
+    """Replaces all rows of the data file kind."""
+    if not is_sqlite():
+        write_text_rows(path, kind, rows, append=False)
+    else:
+        _replace_table(kind, rows)
+    logging.debug("Replaced rows of %s with %s rows", kind, len(rows))
+
+
+def read_entries(entries_path: pathlib.Path) -> List[EntryRow]:
+    """Returns all entries."""
+    return [EntryRow(*row) for row in read_rows(entries_path, ENTRIES)]
+
+
+@profiling.profiled("storage.aggregate_entries")
+def aggregate_entries(entries_path: pathlib.Path) -> Dict[str, Holding]:
+    """
+    Returns quantity and cost basis of the entries summed per stock. Sums of the text
+    file are checkpointed, so only rows appended since the last call are parsed.
+    """
+    if is_sqlite():
+        with connect() as connection:
+            rows = connection.execute(
+                f"SELECT PAIR, SUM(COUNT), SUM(CONVERTED_AMOUNT) FROM {ENTRIES} "
+                "GROUP BY PAIR ORDER BY MIN(rowid)"
+            ).fetchall()
+        return {pair: Holding(quantity, cost) for pair, quantity, cost in rows}
+    return _aggregate_text_entries(entries_path)
+
+
+def _add_entries(totals: Dict[str, List[float]], rows: Iterable[List[str]]) -> None:
+    """Adds quantity and cost basis of the entries rows to the totals."""
+    for row in rows:
+        if not row:
+            continue
+        pair_totals = totals.setdefault(row[1].strip(), [0.0, 0.0])
+        pair_totals[0] += float(row[2])
+        pair_totals[1] += float(row[4])
+
+
+def _add_entries_vectorized(
+    totals: Dict[str, List[float]], data: bytes, header: bool
+) -> None:
+    """Adds quantity and cost basis of the entries text data to the totals."""
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    dataset = pd.read_csv(
+        io.BytesIO(data),
+        sep=" ",
+        quotechar="|",
+        header=None,
+        skiprows=1 if header else 0,
+        usecols=[1, 2, 4],
+        dtype={1: str, 2: float, 4: float},
+    )
+    dataset[1] = dataset[1].str.strip()
+    grouped = dataset.groupby(1, sort=False)[[2, 4]].sum()
+    for pair, quantity, cost_basis in zip(
+        grouped.index.tolist(), grouped[2].tolist(), grouped[4].tolist()
+    ):
+        pair_totals = totals.setdefault(pair, [0.0, 0.0])
+        pair_totals[0] += quantity
+        pair_totals[1] += cost_basis
+
+
+def _aggregate_text_entries(entries_path: pathlib.Path) -> Dict[str, Holding]:
+    """
+    Aggregates entries of the text file from the saved checkpoint. Checkpoint covers
+    complete lines up to its offset and it's used only if hash of this part of the file
+    didn't change, otherwise the whole file is parsed again.
+    """
+    key = str(entries_path.resolve())
+    stat = os.stat(entries_path)
+    checkpoint = cache.load_checkpoint(key)
+    if checkpoint is not None and (checkpoint["size"], checkpoint["mtime_ns"]) == (
+        stat.st_size,
+        stat.st_mtime_ns,
+    ):
+        logging.debug("Entries %s didn't change since the checkpoint", key)
+        return {
+            pair: Holding(*pair_totals)
+            for pair, pair_totals in checkpoint["file_totals"].items()
+        }
+    totals: Dict[str, List[float]] = {}
+    offset = 0
+    digest = hashlib.sha256()
+    with open(entries_path, "rb") as entries_file:
+        if checkpoint is not None and checkpoint["offset"] <= stat.st_size:
+            remaining = checkpoint["offset"]
+            while remaining > 0:
+                chunk = entries_file.read(min(remaining, 1024 * 1024))
+                digest.update(chunk)
+                remaining -= len(chunk)
+            if digest.hexdigest() == checkpoint["digest"]:
+                totals = checkpoint["totals"]
+                offset = checkpoint["offset"]
+            else:
+                logging.debug("Entries %s were rewritten, parsing them again", key)
+                entries_file.seek(0)
+                digest = hashlib.sha256()
+        tail = entries_file.read()
+    complete_end = tail.rfind(b"\n") + 1
+    if complete_end >= _VECTORIZED_PARSE_BYTES:
+        _add_entries_vectorized(totals, tail[:complete_end], header=offset == 0)
+    else:
+        reader = csv.reader(
+            io.StringIO(tail[:complete_end].decode("utf-8"), newline=""),
+            delimiter=" ",
+            quotechar="|",
+        )
+        if offset == 0:
+            next(reader, None)
+        _add_entries(totals, reader)
+    logging.debug("Parsed %s bytes of entries %s", complete_end, key)
+    digest.update(tail[:complete_end])
+    file_totals = totals
+    if complete_end < len(tail):
+        # last line without line break isn't covered by the offset of the checkpoint
+        file_totals = {pair: list(pair_totals) for pair, pair_totals in totals.items()}
+        last_lines = tail[complete_end:].decode("utf-8").splitlines()
+        if offset == 0 and complete_end == 0:
+            last_lines = last_lines[1:]
+        _add_entries(file_totals, csv.reader(last_lines, delimiter=" ", quotechar="|"))
+    cache.save_checkpoint(
+        key,
+        {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "offset": offset + complete_end,
+            "digest": digest.hexdigest(),
+            "totals": totals,
+            "file_totals": file_totals,
+        },
+    )
+    return {pair: Holding(*pair_totals) for pair, pair_totals in file_totals.items()}
+
+
+def read_dividends(dividend_path: pathlib.Path) -> List[DividendRow]:
+    """Returns all dividends."""
+    return [DividendRow(*row) for row in read_rows(dividend_path, DIVIDENDS)]
+
+
+@profiling.profiled("storage.aggregate_dividends")
+def aggregate_dividends(dividend_path: pathlib.Path) -> Dict[str, DividendTotal]:
+    """Returns amount and converted amount of the dividends summed per stock."""
+    totals: Dict[str, DividendTotal] = {}
+    for dividend in read_dividends(dividend_path):
+        amount, converted_amount = totals.get(dividend.pair, DividendTotal(0, 0))
+        totals[dividend.pair] = DividendTotal(
+            amount + dividend.amount, converted_amount + dividend.converted_amount
+        )
+    return totals
+
+
+def read_portfolio(portfolio_path: pathlib.Path) -> List[PortfolioRow]:
+    """Returns all portfolio records."""
+    return [PortfolioRow(*row) for row in read_rows(portfolio_path, PORTFOLIO)]
+
+
+@profiling.profiled("storage.read_portfolio")
+def read_portfolio_frame(portfolio_path: pathlib.Path) -> Any:
+    """Returns portfolio records as pandas dataset with parsed dates."""
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    if is_sqlite():
+        with connect() as connection:
+            dataset = pd.read_sql(
+                f"SELECT DATE, TOTAL_PRICE, PROFIT FROM {PORTFOLIO} ORDER BY rowid",
+                connection,
+            )
+    else:
+        dataset = pd.read_csv(
+            portfolio_path, sep=" ", dtype={"TOTAL_PRICE": float, "PROFIT": float}
+        )
+    dataset["DATE"] = pd.to_datetime(dataset["DATE"], format="%d/%m/%y")
+    return dataset
+
+
+def import_text_file(from_file: pathlib.Path, to_file: pathlib.Path) -> None:
+    """
+    Imports text data file to the data file. Kind of the data is taken from the name
+    of the target file.
+    """
+    if not is_sqlite():
+        cache.clear_checkpoint(str(to_file.resolve()))
+        shutil.copy2(from_file.resolve(), to_file.resolve())
+        return
+    _replace_table(to_file.name, read_text_rows(from_file, to_file.name))
+
+
+def export_text_file(path: pathlib.Path, to_file: pathlib.Path) -> None:
+    """Exports the data file to the text file. Kind of the data is taken from the path."""
+    if not is_sqlite():
+        shutil.copy2(path, to_file)
+        return
+    write_text_rows(to_file, path.name, read_rows(path, path.name), append=False)
+
+
+def migrate_to_sqlite() -> None:
+    """
+    Loads all text data files to the SQLite ledger, existing tables are replaced.
+    Storage type has to be switched to SQLite afterwards.
+    """
+    for path, kind in (
+        (settings.ENTRIES_PATH, ENTRIES),
+        (settings.DIVIDEND_PATH, DIVIDENDS),
+        (settings.PORTFOLIO_PATH, PORTFOLIO),
+    ):
+        rows = read_text_rows(path, kind)
+        _replace_table(kind, rows)
+        logging.info(
+            "Migrated %s rows of %s to %s", len(rows), kind, settings.LEDGER_PATH
+        )
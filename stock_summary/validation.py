@@ -57,9 +57,36 @@ class PairResponse(BaseModel):
 
     @validator("symbol")
     def symbol_is_in_pairs(cls, value: str, values: Dict[str, Any]) -> str:
-        """Check that symbol is in pairs."""
-        if value not in cls.pairs:
-            raise ValueError(
-                f'Got symbol {value} which is not in pairs {values["pairs"]}'
-            )
+        """Check that symbol is in requested pairs, if they are passed."""
+        pairs = values.get("pairs")
+        if pairs and value not in pairs:
+            raise ValueError(f"Got symbol {value} which is not in pairs {pairs}")
+        return value
+
+
+class HistoryMeta(BaseModel):
+    """Meta information of the price history that we get from API."""
+
+    symbol: str
+    currency: str
+
+
+class HistoryItem(BaseModel):
+    """Daily record of the price history that we get from API."""
+
+    date_utc: int
+    close: float
+
+    @validator("close")
+    def close_is_positive(cls, value: float) -> float:
+        """Check that close price is positive."""
+        if value <= 0:
+            raise ValueError(f"Got negative close price {value}")
         return value
+
+
+class PriceHistory(BaseModel):
+    """Daily price history that we get from API for one pair."""
+
+    meta: HistoryMeta
+    items: Dict[str, HistoryItem]
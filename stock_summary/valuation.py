@@ -0,0 +1,192 @@
+""" Vectorized valuation of the holdings """
+import datetime
+import logging
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+from stock_summary import profiling
+from stock_summary.help_structures import DividendRow, EntryRow, Holding, SummaryDict
+from stock_summary.validation import PairResponse, PriceHistory
+
+
+@profiling.profiled("valuation.value_holdings")
+def value_holdings(
+    holdings: Dict[str, Holding],
+    prices: Dict[str, PairResponse],
+    exchange_rates: Dict[str, float],
+) -> pd.DataFrame:
+    """
+    Returns dataset indexed by symbols with count, cost basis, actual price, currency,
+    actual basis and profit of the holdings. Values are converted by exchange rates.
+    Price and currency are needed only for holdings with non-zero count, the others
+    have actual price and basis 0 and empty currency.
+    """
+    dataset = pd.DataFrame(
+        {
+            "count": np.fromiter(
+                (holding.quantity for holding in holdings.values()),
+                dtype=float,
+                count=len(holdings),
+            ),
+            "cost_basis": np.fromiter(
+                (holding.cost_basis for holding in holdings.values()),
+                dtype=float,
+                count=len(holdings),
+            ),
+        },
+        index=pd.Index(list(holdings.keys()), dtype=object, name="symbol"),
+    )
+    held = dataset["count"].to_numpy() != 0
+    held_symbols = dataset.index[held]
+    missing = [symbol for symbol in held_symbols if symbol not in prices]
+    if missing:
+        raise KeyError(f"Missing prices of the pairs {missing}")
+    currencies = pd.Series(
+        [prices[symbol].currency for symbol in held_symbols], dtype=object
+    )
+    rates = currencies.map(exchange_rates)
+    if rates.isna().any():
+        raise KeyError(
+            f"Missing exchange rates of the currencies {set(currencies[rates.isna()])}"
+        )
+    actual_prices = np.zeros(len(dataset))
+    actual_prices[held] = [prices[symbol].regularMarketPrice for symbol in held_symbols]
+    actual_basis = np.zeros(len(dataset))
+    actual_basis[held] = (
+        dataset["count"].to_numpy()[held] * actual_prices[held]
+    ) * rates.to_numpy(dtype=float)
+    dataset["actual_price"] = actual_prices
+    dataset["currency"] = ""
+    dataset.loc[held, "currency"] = currencies.to_numpy()
+    dataset["actual_basis"] = actual_basis
+    dataset["profit"] = dataset["actual_basis"] - dataset["cost_basis"]
+    logging.debug("Valued %s holdings", len(dataset))
+    return dataset
+
+
+def to_summary(dataset: pd.DataFrame) -> Dict[str, SummaryDict]:
+    """Converts dataset from 'value_holdings' to the entries summary."""
+    return {
+        symbol: {
+            "symbol": symbol,
+            "actual_price": actual_price,
+            "actual_basis": actual_basis,
+            "cost_basis": cost_basis,
+            "count": count,
+            "currency": currency,
+        }
+        for symbol, actual_price, actual_basis, cost_basis, count, currency in zip(
+            dataset.index.tolist(),
+            dataset["actual_price"].tolist(),
+            dataset["actual_basis"].tolist(),
+            dataset["cost_basis"].tolist(),
+            dataset["count"].tolist(),
+            dataset["currency"].tolist(),
+        )
+    }
+
+
+def _cumulate(values: pd.Series, days: pd.DatetimeIndex) -> pd.Series:
+    """Returns cumulative sums of the values dated by index for each of the days."""
+    values = values.groupby(level=0).sum()
+    return values.reindex(values.index.union(days), fill_value=0).cumsum().reindex(days)
+
+
+def position_history(
+    entries: Sequence[EntryRow], days: pd.DatetimeIndex
+) -> pd.DataFrame:
+    """
+    Returns dataset with days as index, pairs as columns and held count of the pair
+    at the end of each day as values. Pairs which aren't held in any of the days
+    are left out.
+    """
+    entries_dataset = pd.DataFrame(entries, columns=list(EntryRow._fields))
+    if entries_dataset.empty:
+        return pd.DataFrame(index=days)
+    entries_dataset["date"] = pd.to_datetime(entries_dataset["date"], format="%d/%m/%Y")
+    quantities = entries_dataset.pivot_table(
+        index="date", columns="pair", values="quantity", aggfunc="sum", fill_value=0
+    )
+    positions = pd.DataFrame(
+        {pair: _cumulate(quantities[pair], days) for pair in quantities.columns},
+        index=days,
+    )
+    return positions.loc[:, (positions != 0).any()]
+
+
+def history_closes(history: PriceHistory) -> pd.Series:
+    """Returns daily close prices from the price history indexed by days."""
+    closes = pd.Series(
+        [item.close for item in history.items.values()],
+        index=pd.to_datetime(
+            [item.date_utc for item in history.items.values()], unit="s", utc=True
+        )
+        .tz_localize(None)
+        .normalize(),
+        dtype=float,
+    )
+    return closes.groupby(level=0).last().sort_index()
+
+
+def value_history(
+    entries: Sequence[EntryRow],
+    dividends: Sequence[DividendRow],
+    histories: Dict[str, PriceHistory],
+    exchange_rates: Dict[datetime.datetime, Dict[str, float]],
+    positions: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Values the positions from 'position_history' of the entries at each of their days
+    by the last known close price and exchange rates of the day. Returns dataset with
+    DATE, TOTAL_PRICE and PROFIT columns, profit includes dividends paid until the day.
+    """
+    days = pd.DatetimeIndex(positions.index)
+    missing = [pair for pair in positions.columns if pair not in histories]
+    if missing:
+        raise KeyError(f"Missing price history of the pairs {missing}")
+    closes = pd.DataFrame(
+        {
+            pair: history_closes(histories[pair]).reindex(days, method="ffill")
+            for pair in positions.columns
+        },
+        index=days,
+    )
+    if (closes.isna() & (positions != 0)).any().any():
+        raise ValueError("Price history doesn't cover all days with held pairs")
+    rates = pd.DataFrame(
+        [
+            [
+                exchange_rates[day][histories[pair].meta.currency]
+                for pair in positions.columns
+            ]
+            for day in days.to_pydatetime()
+        ],
+        index=days,
+        columns=positions.columns,
+        dtype=float,
+    )
+    total_price = (positions * closes.fillna(0) * rates).sum(axis=1)
+    entries_dataset = pd.DataFrame(entries, columns=list(EntryRow._fields))
+    cost_basis = _cumulate(
+        entries_dataset.set_index(
+            pd.to_datetime(entries_dataset["date"], format="%d/%m/%Y")
+        )["converted_amount"].astype(float),
+        days,
+    )
+    dividends_dataset = pd.DataFrame(dividends, columns=list(DividendRow._fields))
+    dividend_sum = _cumulate(
+        dividends_dataset.set_index(
+            pd.to_datetime(dividends_dataset["date"], format="%d/%m/%Y")
+        )["converted_amount"].astype(float),
+        days,
+    )
+    logging.debug("Valued %s days of the portfolio history", len(days))
+    return pd.DataFrame(
+        {
+            "DATE": days,
+            "TOTAL_PRICE": total_price.to_numpy(),
+            "PROFIT": (total_price - cost_basis + dividend_sum).to_numpy(),
+        }
+    )
@@ -0,0 +1,95 @@
+""" Generator of synthetic data files for the benchmarks """
+import csv
+import datetime
+import math
+import pathlib
+import random
+from typing import Iterator, List, Tuple
+
+START_DATE = datetime.date(1990, 1, 1)
+# Portfolio spans the same range of days for all sizes, bigger files have several
+# records per day
+PORTFOLIO_DAYS = 10000
+CURRENCIES = ("USD", "EUR", "CZK")
+
+
+def get_pairs(count: int) -> List[str]:
+    """Returns symbols of the synthetic pairs."""
+    return [f"P{index:04d}" for index in range(count)]
+
+
+def get_currency(pair: str) -> str:
+    """Returns currency of the synthetic pair."""
+    return CURRENCIES[int(pair[1:]) % len(CURRENCIES)]
+
+
+def _write_rows(
+    path: pathlib.Path, header: Tuple[str, ...], rows: Iterator[Tuple[object, ...]]
+) -> None:
+    """Writes rows to the data file in the same format as the application."""
+    with open(path, "w", newline="", encoding="utf-8") as csvfile:
+        csv_writer = csv.writer(csvfile, delimiter=" ", quotechar="|")
+        csv_writer.writerow(header)
+        csv_writer.writerows(rows)
+
+
+def generate_data_files(
+    path: pathlib.Path, rows: int, pairs: int = 200, seed: int = 0
+) -> None:
+    """
+    Generates entries, dividends and portfolio files with the rows in the directory.
+    Entries are mostly buys, so all pairs stay held.
+    """
+    rng = random.Random(seed)
+    symbols = get_pairs(pairs)
+
+    def entries() -> Iterator[Tuple[object, ...]]:
+        for index in range(rows):
+            count = rng.choice((1, 2, 5, 10, -1))
+            price = round(rng.uniform(1, 500), 2)
+            yield (
+                (START_DATE + datetime.timedelta(days=index // 10)).strftime(
+                    "%d/%m/%Y"
+                ),
+                rng.choice(symbols),
+                float(count),
+                count * price,
+                round(count * price * 25, 2),
+            )
+
+    def dividends() -> Iterator[Tuple[object, ...]]:
+        for index in range(rows):
+            amount = round(rng.uniform(0.1, 50), 2)
+            yield (
+                (START_DATE + datetime.timedelta(days=index // 10)).strftime(
+                    "%d/%m/%Y"
+                ),
+                rng.choice(symbols),
+                amount,
+                round(amount * 25, 2),
+            )
+
+    def portfolio() -> Iterator[Tuple[object, ...]]:
+        total_price = 100000.0
+        # Random walk which moves by tens of percent over the whole range
+        step = 0.3 / math.sqrt(rows)
+        for index in range(rows):
+            total_price *= math.exp(rng.gauss(0, step))
+            yield (
+                (
+                    START_DATE
+                    + datetime.timedelta(days=index * PORTFOLIO_DAYS // rows)
+                ).strftime("%d/%m/%y"),
+                round(total_price, 2),
+                round(total_price - 100000, 2),
+            )
+
+    _write_rows(
+        path / "entries",
+        ("DATE", "PAIR", "COUNT", "PRICE", "CONVERTED_AMOUNT"),
+        entries(),
+    )
+    _write_rows(
+        path / "dividends", ("DATE", "PAIR", "AMOUNT", "CONVERTED_AMOUNT"), dividends()
+    )
+    _write_rows(path / "portfolio", ("DATE", "TOTAL_PRICE", "PROFIT"), portfolio())
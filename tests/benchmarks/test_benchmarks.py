@@ -0,0 +1,100 @@
+"""
+Benchmarks of the main commands on the synthetic data files with mocked network.
+Sizes of the data files are set by BENCHMARK_ROWS (comma separated, default 10000).
+"""
+import os
+import pathlib
+from typing import Any, Dict, Iterator, Set
+from unittest.mock import patch
+
+import pytest
+
+from stock_summary import cache, library, main, settings
+from stock_summary.help_structures import CloudType
+from stock_summary.validation import PairResponse
+from tests.benchmarks.generator import generate_data_files, get_currency
+
+pytest.importorskip("pytest_benchmark")
+
+# Benchmarks are deselected by default, run them by 'make benchmarks'
+pytestmark = pytest.mark.benchmarks
+
+ROWS = [int(rows) for rows in os.environ.get("BENCHMARK_ROWS", "10000").split(",")]
+PAIRS = 200
+EXCHANGE_RATES = {"USD": 22.0, "EUR": 24.0, "CZK": 1.0}
+
+
+def _get_pair_prices(pairs: Set[str], *_: Any) -> Dict[str, PairResponse]:
+    """Returns synthetic prices of the pairs."""
+    return {
+        pair: PairResponse(
+            currency=get_currency(pair), regularMarketPrice=100, symbol=pair
+        )
+        for pair in pairs
+    }
+
+
+@pytest.fixture(scope="module", params=ROWS, ids=lambda rows: f"{rows}_rows")
+def data_path(
+    request: pytest.FixtureRequest, tmp_path_factory: pytest.TempPathFactory
+) -> pathlib.Path:
+    """Returns directory with the generated data files."""
+    path = tmp_path_factory.mktemp(f"data_{request.param}")
+    generate_data_files(path, request.param, pairs=PAIRS)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def mocked_environment(data_path: pathlib.Path) -> Iterator[None]:
+    """Points the settings to the generated data files and mocks the network."""
+    with patch.multiple(
+        settings,
+        CLOUD_TYPE=CloudType.NONE,
+        ENTRIES_PATH=data_path / "entries",
+        DIVIDEND_PATH=data_path / "dividends",
+        PORTFOLIO_PATH=data_path / "portfolio",
+    ), patch.object(
+        library, "get_pair_prices", side_effect=_get_pair_prices
+    ), patch.object(
+        library, "get_exchange_rates", return_value=EXCHANGE_RATES
+    ):
+        yield
+
+
+def test_entries_summary(benchmark: Any) -> None:
+    """Benchmarks entries summary with checkpoint of the entries file."""
+    summary = benchmark(library.get_entries_summary)
+    assert len(summary) == PAIRS
+
+
+def test_entries_summary_cold(benchmark: Any) -> None:
+    """Benchmarks entries summary which has to parse the whole entries file."""
+    summary = benchmark.pedantic(
+        library.get_entries_summary,
+        setup=lambda: cache.clear_checkpoint(str(settings.ENTRIES_PATH.resolve())),
+        rounds=5,
+    )
+    assert len(summary) == PAIRS
+
+
+def test_dividend_summary(benchmark: Any) -> None:
+    """Benchmarks dividend summary."""
+    summary = benchmark(library.get_dividend_summary)
+    assert len(summary) == PAIRS
+
+
+def test_generate_portfolio(benchmark: Any) -> None:
+    """Benchmarks generate-portfolio command, each round appends one record."""
+    benchmark(main.generate_portfolio_main)
+
+
+def test_prepare_portfolio_data(benchmark: Any) -> None:
+    """Benchmarks reading of the portfolio file."""
+    dataset = benchmark(library.prepare_portfolio_data)
+    assert len(dataset) >= min(ROWS)
+
+
+def test_plot_html(benchmark: Any) -> None:
+    """Benchmarks rendering of the portfolio plot."""
+    html = benchmark(library.get_plot_html, library.prepare_portfolio_data())
+    assert html
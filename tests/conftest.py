@@ -0,0 +1,70 @@
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, NamedTuple, Set
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from stock_summary import settings
+from stock_summary.help_structures import CloudType
+from stock_summary.validation import PairResponse
+
+TESTING_DATASETS_PATH = Path(__file__).parent.resolve() / "testing_data"
+
+
+class ApiMocks(NamedTuple):
+    """Mocks of the quotes and exchange rates fetched from the APIs"""
+
+    pair_prices: MagicMock
+    exchange_rates: MagicMock
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path: Path) -> Iterator[None]:
+    """Keeps cache and snapshot of the tests away from the user data directory."""
+    with patch.multiple(
+        settings,
+        CACHE_PATH=tmp_path / "cache.sqlite",
+        SNAPSHOT_PATH=tmp_path / "snapshot.json",
+    ):
+        yield
+
+
+@pytest.fixture
+def data_path(tmp_path: Path) -> Iterator[Path]:
+    """
+    Copies data files of the testing dataset A to the directory, settings point to
+    them and to the HTML files in the same directory. Cloud is turned off.
+    """
+    path = tmp_path / "data"
+    path.mkdir()
+    for name in ("entries", "dividends", "portfolio"):
+        shutil.copy2(TESTING_DATASETS_PATH / "testing_data_A" / name, path)
+    with patch.multiple(
+        settings,
+        CLOUD_TYPE=CloudType.NONE,
+        ENTRIES_PATH=path / "entries",
+        DIVIDEND_PATH=path / "dividends",
+        PORTFOLIO_PATH=path / "portfolio",
+        INDEX_HTML_FILE=path / "index.html",
+        MAIN_CSS_FILE=path / "main.css",
+    ):
+        yield path
+
+
+@pytest.fixture
+def api_mocks() -> Iterator[ApiMocks]:
+    """Mocks the APIs, all pairs cost 20 EUR and 1 EUR is 25 CZK."""
+
+    def get_pair_prices(pairs: Set[str]) -> Dict[str, PairResponse]:
+        return {
+            pair: PairResponse(currency="EUR", regularMarketPrice=20, symbol=pair)
+            for pair in pairs
+        }
+
+    with patch(
+        "stock_summary.library.get_pair_prices", side_effect=get_pair_prices
+    ) as pair_prices_mock, patch(
+        "stock_summary.library.get_exchange_rates", return_value={"EUR": 25}
+    ) as exchange_mock:
+        yield ApiMocks(pair_prices_mock, exchange_mock)
@@ -1,12 +1,98 @@
-from unittest.mock import patch
+import gzip
+import io
+import os
+import stat
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator
+from unittest.mock import MagicMock, patch
 
 import pytest
 from azure.core.exceptions import ServiceRequestError
 
 from stock_summary import settings
-from stock_summary.clouds import azure
-from stock_summary.clouds.logic import get_cloud
-from stock_summary.help_structures import CloudType
+from stock_summary.clouds import azure, compression, local
+from stock_summary.clouds.logic import (
+    _get_azure,
+    get_cloud,
+    sync_files_down,
+    sync_files_up,
+)
+from stock_summary.help_structures import CloudCompression, CloudType
+
+AzureFactory = Callable[[Any], azure.Azure]
+
+
+class FakeFileClient:
+    """In-memory cloud file with the API of the Azure file client."""
+
+    def __init__(self, content: bytes = b"") -> None:
+        self.content = bytearray(content)
+        self.version = 0
+        self.lease = MagicMock()
+
+    def _response(self) -> Dict[str, str]:
+        """Returns response of the changing request with new ETag of the file."""
+        self.version += 1
+        return {"etag": f'"{self.version}"'}
+
+    def get_file_properties(self) -> MagicMock:
+        """Returns ETag and size of the file."""
+        return MagicMock(etag=f'"{self.version}"', size=len(self.content))
+
+    def upload_file(self, data: BinaryIO, length: int) -> Dict[str, str]:
+        """Replaces content of the file with the data."""
+        self.content = bytearray(data.read(length))
+        return self._response()
+
+    def acquire_lease(self) -> MagicMock:
+        """Returns lease of the file."""
+        return self.lease
+
+    def resize_file(self, size: int, lease: Any) -> Dict[str, str]:
+        """Truncates the file or pads it with zeros to the size."""
+        assert lease is self.lease
+        self.content = self.content[:size].ljust(size, b"\0")
+        return self._response()
+
+    def upload_range(
+        self, data: bytes, offset: int, length: int, lease: Any
+    ) -> Dict[str, str]:
+        """Writes the data to the range of the file."""
+        assert lease is self.lease
+        self.content[offset : offset + length] = data
+        return self._response()
+
+    def download_file(self) -> MagicMock:
+        """Returns download stream of the file."""
+        stream = MagicMock()
+        stream.readinto.side_effect = lambda target: target.write(self.content)
+        stream.properties.etag = f'"{self.version}"'
+        return stream
+
+
+@pytest.fixture(name="azure_cloud")
+def fixture_azure_cloud(tmp_path: Path) -> Iterator[AzureFactory]:
+    """
+    Yields function which creates Azure cloud without connection, its cloud files
+    are served by the given file client. Entries and portfolio in the tmp_path are
+    mapped to the cloud.
+    """
+    with patch.object(azure.Azure, "check_connection"), patch.object(
+        azure.Azure, "get_share_client"
+    ) as share_client, patch.object(
+        azure.Azure,
+        "CLOUD_FILES_MAPPING",
+        {tmp_path / "entries": "entries", tmp_path / "portfolio": "portfolio"},
+    ):
+
+        def create_azure(file_client: Any) -> azure.Azure:
+            share_client.return_value.get_file_client.return_value = file_client
+            return azure.Azure(
+                "DefaultEndpointsProtocol=https;AccountName=test;"
+                "AccountKey=test==;EndpointSuffix=core.windows.net"
+            )
+
+        yield create_azure
 
 
 def test_invalid_azure_settings() -> None:
@@ -27,3 +113,203 @@ def test_invalid_azure_settings() -> None:
 
     with pytest.raises(ServiceRequestError):
         cloud.check_connection()
+
+
+def test_azure_skips_unchanged_files(tmp_path: Path, azure_cloud: AzureFactory) -> None:
+    """Tests that files without changes aren't transferred again."""
+    local_path = tmp_path / "entries"
+    file_client = MagicMock()
+    file_client.get_file_properties.return_value.etag = '"1"'
+    file_client.get_file_properties.return_value.size = 4
+    file_client.download_file.return_value.readinto.side_effect = lambda stream: (
+        stream.write(b"data")
+    )
+    file_client.download_file.return_value.properties.etag = '"1"'
+    file_client.upload_file.return_value = {"etag": '"2"'}
+    cloud = azure_cloud(file_client)
+    cloud.sync_file_down(local_path)
+    cloud.sync_file_down(local_path)
+    assert file_client.download_file.call_count == 1
+    assert local_path.read_bytes() == b"data"
+    cloud.sync_file_up(local_path)
+    file_client.upload_file.assert_not_called()
+    local_path.write_bytes(b"atad")
+    cloud.sync_file_up(local_path)
+    assert file_client.upload_file.call_count == 1
+    file_client.get_file_properties.return_value.etag = '"2"'
+    cloud.sync_file_down(local_path)
+    assert file_client.download_file.call_count == 1
+
+
+def test_azure_client_is_reused() -> None:
+    """Tests that one Azure client is used per process and share is created once."""
+    connection_str = (
+        "DefaultEndpointsProtocol=https;AccountName=reused;"
+        "AccountKey=test==;EndpointSuffix=core.windows.net"
+    )
+    _get_azure.cache_clear()
+    with patch.object(
+        settings, "AZURE_CONNECTION_STR", connection_str
+    ), patch.object(azure.Azure, "check_connection"), patch.object(
+        azure.Azure, "get_share_client"
+    ) as share_client:
+        cloud = get_cloud(cloud_type=CloudType.AZURE)
+        assert get_cloud(cloud_type=CloudType.AZURE) is cloud
+        azure.Azure(connection_str)
+        assert share_client.return_value.create_share.call_count == 1
+    _get_azure.cache_clear()
+
+
+def test_sync_failures_are_reported_per_file() -> None:
+    """Tests that all files are synced even if some of them fails."""
+
+    def sync_file_down(path: Path) -> int:
+        if path.name == "dividends":
+            raise KeyError(path)
+        return 0
+
+    cloud = MagicMock()
+    cloud.sync_file_down.side_effect = sync_file_down
+    paths = [Path("entries"), Path("dividends"), Path("portfolio")]
+    with patch("stock_summary.clouds.logic.get_cloud", return_value=cloud):
+        with pytest.raises(KeyError):
+            sync_files_down(cloud_type=CloudType.AZURE, paths=paths)
+    assert {call.args[0] for call in cloud.sync_file_down.call_args_list} == set(paths)
+
+
+def test_azure_uploads_appended_tail(tmp_path: Path, azure_cloud: AzureFactory) -> None:
+    """Tests that only the appended tail of the file is uploaded."""
+    local_path = tmp_path / "portfolio"
+    file_client = MagicMock()
+    file_client.get_file_properties.return_value.etag = '"1"'
+    file_client.get_file_properties.return_value.size = 5
+    file_client.download_file.return_value.readinto.side_effect = lambda stream: (
+        stream.write(b"data\n")
+    )
+    file_client.download_file.return_value.properties.etag = '"1"'
+    file_client.upload_range.return_value = {"etag": '"2"'}
+    file_client.upload_file.return_value = {"etag": '"3"'}
+    cloud = azure_cloud(file_client)
+    cloud.sync_file_down(local_path)
+    with open(local_path, "ab") as local_file:
+        local_file.write(b"more\n")
+    cloud.sync_file_up(local_path)
+    lease = file_client.acquire_lease.return_value
+    file_client.upload_file.assert_not_called()
+    file_client.resize_file.assert_called_once_with(10, lease=lease)
+    file_client.upload_range.assert_called_once_with(
+        b"more\n", offset=5, length=5, lease=lease
+    )
+    assert lease.release.call_count == 1
+    file_client.get_file_properties.return_value.etag = '"2"'
+    file_client.get_file_properties.return_value.size = 10
+    local_path.write_bytes(b"rewritten\n")
+    cloud.sync_file_up(local_path)
+    assert file_client.upload_file.call_count == 1
+
+    # The cloud file changed before it was leased, so the whole file is uploaded
+    file_client.get_file_properties.side_effect = [
+        MagicMock(etag='"3"', size=10),
+        MagicMock(etag='"4"', size=12),
+    ]
+    with open(local_path, "ab") as local_file:
+        local_file.write(b"more\n")
+    cloud.sync_file_up(local_path)
+    file_client.resize_file.assert_called_once()
+    assert file_client.upload_file.call_count == 2
+    assert file_client.upload_file.call_args.kwargs["length"] == 15
+    assert lease.release.call_count == 2
+
+
+def test_azure_failed_download_keeps_local_file(
+    tmp_path: Path, azure_cloud: AzureFactory
+) -> None:
+    """Tests that half-downloaded file doesn't replace the local copy."""
+
+    def readinto(stream: BinaryIO) -> None:
+        stream.write(b"half")
+        raise ServiceRequestError("Connection lost")
+
+    local_path = tmp_path / "entries"
+    local_path.write_bytes(b"local data")
+    file_client = MagicMock()
+    file_client.download_file.return_value.readinto.side_effect = readinto
+    cloud = azure_cloud(file_client)
+    with pytest.raises(ServiceRequestError):
+        cloud.sync_file_down(local_path)
+    assert local_path.read_bytes() == b"local data"
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_azure_compression(tmp_path: Path, azure_cloud: AzureFactory) -> None:
+    """Tests compressed cloud files and detection of the uncompressed ones."""
+    local_path = tmp_path / "entries"
+    data = b"DATE,PAIR,COUNT,PRICE,CONVERTED_AMOUNT\r\n" * 100
+    file_client = FakeFileClient(data)
+    with patch.object(settings, "CLOUD_COMPRESSION", CloudCompression.GZIP):
+        cloud = azure_cloud(file_client)
+        cloud.sync_file_down(local_path)
+        assert local_path.read_bytes() == data
+        with open(local_path, "ab") as local_file:
+            local_file.write(b"01/01/2023,AAPL,1,100,2000\r\n")
+        cloud.sync_file_up(local_path)
+        assert file_client.content.startswith(compression.GZIP_MAGIC)
+        assert len(file_client.content) < len(data)
+        with open(local_path, "ab") as local_file:
+            local_file.write(b"02/01/2023,AAPL,1,100,2000\r\n")
+        compressed = bytes(file_client.content)
+        cloud.sync_file_up(local_path)
+        assert file_client.content.startswith(compressed)
+        assert gzip.decompress(file_client.content) == local_path.read_bytes()
+        expected = local_path.read_bytes()
+        local_path.unlink()
+        cloud.sync_file_down(local_path)
+        assert local_path.read_bytes() == expected
+        umask = os.umask(0)
+        os.umask(umask)
+        assert stat.S_IMODE(local_path.stat().st_mode) == 0o666 & ~umask
+
+        local_path.chmod(0o640)
+        file_client.upload_file(io.BytesIO(data), len(data))
+        cloud.sync_file_down(local_path)
+        assert local_path.read_bytes() == data
+        assert stat.S_IMODE(local_path.stat().st_mode) == 0o640
+
+
+def test_local_cloud(tmp_path: Path) -> None:
+    """Tests syncing of the files with the local directory and the sync stats."""
+    local_path = tmp_path / "data" / "entries"
+    local_path.parent.mkdir()
+    local_path.write_bytes(b"data")
+    settings.LOCAL_CLOUD_PATH = tmp_path / "nas"
+    with pytest.raises(FileNotFoundError):
+        get_cloud(cloud_type=CloudType.LOCAL)
+    assert not (tmp_path / "nas").exists()
+    (tmp_path / "nas").mkdir()
+    with patch.object(
+        local.LocalCloud,
+        "CLOUD_FILES_MAPPING",
+        {local_path: "entries", tmp_path / "data" / "portfolio": "history/portfolio"},
+    ):
+        assert isinstance(get_cloud(cloud_type=CloudType.LOCAL), local.LocalCloud)
+        stats = sync_files_up(cloud_type=CloudType.LOCAL, paths=[local_path])
+        assert [(stat.path, stat.transferred) for stat in stats] == [(local_path, 4)]
+        assert (tmp_path / "nas" / "entries").read_bytes() == b"data"
+        stats = sync_files_up(cloud_type=CloudType.LOCAL, paths=[local_path])
+        assert stats[0].transferred == 0
+        (tmp_path / "nas" / "entries").write_bytes(b"cloud data")
+        local_path.chmod(0o640)
+        stats = sync_files_down(cloud_type=CloudType.LOCAL, paths=[local_path])
+        assert stats[0].transferred == 10
+        assert local_path.read_bytes() == b"cloud data"
+        assert stat.S_IMODE(local_path.stat().st_mode) == 0o640
+        stats = sync_files_down(cloud_type=CloudType.LOCAL, paths=[local_path])
+        assert stats[0].transferred == 0
+        portfolio_path = tmp_path / "data" / "portfolio"
+        portfolio_path.write_bytes(b"portfolio")
+        sync_files_up(cloud_type=CloudType.LOCAL, paths=[portfolio_path])
+        assert (tmp_path / "nas" / "history" / "portfolio").read_bytes() == b"portfolio"
+    assert not list((tmp_path / "nas").glob("*.part"))
+    settings.LOCAL_CLOUD_PATH = None
+    with pytest.raises(ValueError):
+        get_cloud(cloud_type=CloudType.LOCAL)
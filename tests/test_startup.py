@@ -0,0 +1,40 @@
+import subprocess
+import sys
+
+# Cumulative import time of the CLI module, generous to stay stable on slow machines
+IMPORT_TIME_BUDGET_US = 500_000
+HEAVY_MODULES = {
+    "azure",
+    "dotenv",
+    "jinja2",
+    "numpy",
+    "pandas",
+    "plotly",
+    "pydantic",
+    "requests",
+}
+
+
+def test_cli_import_time() -> None:
+    """Tests that the CLI starts without heavy dependencies and within the budget."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import sys, stock_summary.main; "
+            "print(','.join(sorted({name.split('.')[0] for name in sys.modules})))",
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    loaded = set(result.stdout.strip().split(","))
+    assert not loaded & HEAVY_MODULES
+    main_import = next(
+        line
+        for line in result.stderr.splitlines()
+        if line.split("|")[-1].strip() == "stock_summary.main"
+    )
+    assert int(main_import.split("|")[1]) < IMPORT_TIME_BUDGET_US
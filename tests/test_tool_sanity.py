@@ -1,5 +1,6 @@
+import functools
 import socket
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Set, Tuple
 
 sock = socket.socket
 
@@ -9,11 +10,12 @@ class NetworkBlocker(socket.socket):
         raise Exception("Network call blocked")
 
 
-def block_network(function: Callable[[], None]) -> Callable[[], None]:
-    def wrapper_blocking_network() -> None:
+def block_network(function: Callable[..., None]) -> Callable[..., None]:
+    @functools.wraps(function)
+    def wrapper_blocking_network(*args: Any, **kwargs: Any) -> None:
         try:
             socket.socket = NetworkBlocker  # type: ignore
-            function()
+            function(*args, **kwargs)
         except Exception as err:
             raise err
         finally:
@@ -25,12 +27,60 @@ def block_network(function: Callable[[], None]) -> Callable[[], None]:
 socket.socket = NetworkBlocker  # type: ignore
 
 
+import datetime
+import json
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
-from stock_summary.library import get_dividend_sum, get_entries_summary, get_pairs
-from stock_summary.validation import PairResponse
+import numpy as np
+import pandas as pd
+import pytest
+from dotenv import dotenv_values
+from pydantic import ValidationError
+
+from stock_summary import cache, main, profiling, settings, storage
+from stock_summary.downsampling import lttb_indices
+from stock_summary.help_structures import (
+    CloudType,
+    DividendRow,
+    DividendTotal,
+    EntryRow,
+    Holding,
+    PortfolioRow,
+    StorageType,
+    SyncStats,
+)
+from stock_summary.ledger import Ledger
+from stock_summary.valuation import position_history, to_summary, value_holdings
+from stock_summary.library import (
+    backfill_portfolio,
+    export_data,
+    get_dividend_sum,
+    get_entries_summary,
+    get_exchange_rates,
+    get_pair_prices,
+    get_pairs,
+    get_plot_html,
+    get_plotly_js_name,
+    prepare_dividends,
+    prepare_entries,
+    prepare_portfolio_data,
+    save_variables_to_file,
+    write_plotly_js,
+)
+from stock_summary.validation import (
+    HistoryItem,
+    HistoryMeta,
+    PairResponse,
+    PriceHistory,
+)
 from stock_summary.settings import INIT_DATASETS_PATH
+from stock_summary.snapshot import load_snapshot
+from tests.conftest import ApiMocks
 
 TESTING_DATASETS_PATH = Path(__file__).parent.resolve() / "testing_data"
 # unblock connection again
@@ -169,6 +219,58 @@ def test_html_output() -> None:
     """testing html output from main function"""
 
 
+@block_network
+def test_plot_html() -> None:
+    """Testing that plot references shared plotly.js bundle instead of inlining it"""
+    with patch.object(
+        settings, "PORTFOLIO_PATH", TESTING_DATASETS_PATH / "testing_data_A" / "portfolio"
+    ):
+        plot_html = get_plot_html(prepare_portfolio_data())
+    assert f'src="{get_plotly_js_name()}"' in plot_html
+    assert "<html>" not in plot_html
+    assert len(plot_html) < 100_000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        old_bundle = Path(tmp_dir) / "plotly-0.0.0.min.js"
+        old_bundle.write_text("old", encoding="utf-8")
+        bundle = write_plotly_js(Path(tmp_dir))
+        assert bundle.name == get_plotly_js_name()
+        assert bundle.stat().st_size > 1_000_000
+        assert not old_bundle.exists()
+        with patch("plotly.offline.get_plotlyjs") as plotlyjs_mock:
+            assert write_plotly_js(Path(tmp_dir)) == bundle
+            plotlyjs_mock.assert_not_called()
+
+
+@block_network
+def test_plot_downsampling() -> None:
+    """Testing that long portfolio series are downsampled with their extremes kept"""
+    x = np.arange(10_000)
+    y = np.sin(x / 500)
+    y[4321] = 10
+    indices = lttb_indices(x, y, 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+    assert 4321 in indices
+    assert lttb_indices(x[:50], y[:50], 100).tolist() == list(range(50))
+    dataset = pd.DataFrame(
+        {
+            "DATE": pd.date_range("2020-01-01", periods=len(x), freq="h"),
+            "TOTAL_PRICE": y + 100,
+            "PROFIT": y,
+        }
+    )
+    with patch.multiple(settings, PLOT_MAX_POINTS=500, PLOT_WEBGL_POINTS=400):
+        plot_html = get_plot_html(dataset)
+    assert plot_html.count('"type":"scattergl","xaxis"') == 2
+    with patch.multiple(settings, PLOT_MAX_POINTS=2000, PLOT_WEBGL_POINTS=5000):
+        plot_html = get_plot_html(dataset)
+    assert plot_html.count('"type":"scattergl","xaxis"') == 2
+    with patch.multiple(settings, PLOT_MAX_POINTS=500, PLOT_WEBGL_POINTS=20000):
+        plot_html = get_plot_html(dataset)
+    assert plot_html.count('"type":"scatter","xaxis"') == 2
+
+
 @block_network
 def test_dividend_sum() -> None:
     """Testing get_dividend_sum function"""
@@ -188,3 +290,507 @@ def test_get_pairs() -> None:
     assert len(pairs) == 2
     pairs = get_pairs(entries_path=INIT_DATASETS_PATH / "entries")
     assert len(pairs) == 0
+
+
+@block_network
+def test_exchange_rates_cache() -> None:
+    """Testing that exchange rates are served from the persistent cache"""
+    response = MagicMock()
+    response.text = json.dumps({"base": "CZK", "rates": {"EUR": 0.04}})
+    with patch("stock_summary.library.get_http_session") as session_mock:
+        request_mock = session_mock.return_value.request
+        request_mock.return_value = response
+        date = datetime.datetime(2023, 1, 12)
+        assert get_exchange_rates(date) == {"EUR": 25}
+        get_exchange_rates.cache_clear()
+        assert get_exchange_rates(date) == {"EUR": 25}
+        assert request_mock.call_count == 1
+        get_exchange_rates()
+        get_exchange_rates.cache_clear()
+        get_exchange_rates()
+        assert request_mock.call_count == 2
+        with patch.object(settings, "EXCHANGE_RATE_TTL", 0):
+            get_exchange_rates.cache_clear()
+            get_exchange_rates()
+        assert request_mock.call_count == 3
+    get_exchange_rates.cache_clear()
+
+
+@block_network
+def test_pair_prices_cache() -> None:
+    """Testing that only missing and stale quotes are requested"""
+
+    def quotes_response(url: str) -> MagicMock:
+        response = MagicMock()
+        response.text = json.dumps(
+            {
+                "body": [
+                    {"symbol": symbol, "regularMarketPrice": 10, "currency": "EUR"}
+                    for symbol in url.rsplit("/", 1)[1].split(",")
+                ]
+            }
+        )
+        return response
+
+    with patch("stock_summary.library.get_http_session") as session_mock:
+        request_mock = session_mock.return_value.request
+        request_mock.side_effect = lambda method, url, **_: quotes_response(url)
+        assert set(get_pair_prices({"A", "B"}).keys()) == {"A", "B"}
+        prices = get_pair_prices({"A", "B", "C"})
+        assert set(prices.keys()) == {"A", "B", "C"}
+        assert prices["A"].regularMarketPrice == 10
+        assert request_mock.call_count == 2
+        assert request_mock.call_args[0][1].endswith("/C")
+        get_pair_prices({"A"}, max_age=0)
+        assert request_mock.call_count == 3
+
+        with patch.object(settings, "STOCK_PRICE_CHUNK_SIZE", 2):
+            prices = get_pair_prices({f"S{index}" for index in range(5)})
+        assert len(prices) == 5
+        assert request_mock.call_count == 6
+
+        with patch.object(settings, "STOCK_PRICE_CHUNK_SIZE", 1):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(
+                    executor.map(
+                        get_pair_prices,
+                        [{f"T{index}", f"U{index}"} for index in range(8)],
+                    )
+                )
+        assert [set(result) for result in results] == [
+            {f"T{index}", f"U{index}"} for index in range(8)
+        ]
+
+        request_mock.side_effect = lambda method, url, **_: quotes_response(url + ",X")
+        with pytest.raises(ValidationError):
+            get_pair_prices({"D"})
+
+
+@block_network
+def test_generate_portfolio(data_path: Path, api_mocks: ApiMocks) -> None:
+    """Testing generate-portfolio command on the testing data"""
+    prices = {"A": 20, "B": 10}
+    api_mocks.pair_prices.side_effect = lambda pairs: {
+        pair: PairResponse(currency="EUR", regularMarketPrice=prices[pair], symbol=pair)
+        for pair in pairs
+    }
+    main.generate_portfolio_main()
+    last_line = (data_path / "portfolio").read_text().splitlines()[-1]
+    assert last_line.split(" ")[1:] == ["3750.0", "3467.0"]
+
+
+@pytest.mark.usefixtures("api_mocks")
+@block_network
+def test_profile_report(data_path: Path) -> None:
+    """Testing that stages of the command are written to the profile report"""
+    main.global_main(
+        profile=str(data_path / "profile.json"),
+        cprofile=str(data_path / "profile.prof"),
+    )
+    assert profiling.is_enabled()
+    main.generate_portfolio_main()
+    profiling.write_report()
+    assert not profiling.is_enabled()
+    report = json.loads((data_path / "profile.json").read_text())
+    assert report["total_seconds"] > 0
+    assert report["stages"]["storage.aggregate_entries"]["calls"] == 1
+    assert report["stages"]["valuation.value_holdings"]["calls"] == 1
+    assert (data_path / "profile.prof").stat().st_size > 0
+
+
+@block_network
+def test_report_regeneration(data_path: Path, api_mocks: ApiMocks) -> None:
+    """Testing that HTML report is rendered again only when its inputs change"""
+    with patch(
+        "stock_summary.library.get_entries_summary", wraps=get_entries_summary
+    ) as summary_mock, patch(
+        "stock_summary.library.get_plot_html", wraps=get_plot_html
+    ) as plot_mock, patch(
+        "stock_summary.main.webbrowser.open"
+    ) as browser_mock:
+        main.generate_html_main()
+        index_html = (data_path / "index.html").read_text(encoding="utf-8")
+        assert (summary_mock.call_count, plot_mock.call_count) == (1, 1)
+
+        (data_path / "index.html").unlink()
+        api_mocks.exchange_rates.reset_mock()
+        with patch.object(Ledger, "load") as load_mock:
+            main.generate_html_main()
+        load_mock.assert_not_called()
+        api_mocks.exchange_rates.assert_not_called()
+        assert (summary_mock.call_count, plot_mock.call_count) == (1, 1)
+        assert (data_path / "index.html").read_text(encoding="utf-8") == index_html
+
+        cache.save_quotes(
+            {"A": {"symbol": "A", "regularMarketPrice": 21, "currency": "EUR"}}
+        )
+        main.generate_html_main()
+        assert (summary_mock.call_count, plot_mock.call_count) == (2, 1)
+
+        with patch.object(settings, "QUOTE_TTL", -1):
+            main.generate_html_main()
+        assert (summary_mock.call_count, plot_mock.call_count) == (3, 1)
+
+        with open(data_path / "portfolio", "a", encoding="utf-8") as portfolio:
+            portfolio.write("03/12/22 3000 0\n")
+        main.generate_html_main()
+        assert (summary_mock.call_count, plot_mock.call_count) == (4, 2)
+    assert browser_mock.call_count == 5
+    assert (data_path / "main.css").exists()
+    assert (data_path / get_plotly_js_name()).exists()
+
+
+@block_network
+def test_valuation_snapshot(data_path: Path, api_mocks: ApiMocks) -> None:
+    """Testing that generate-html renders from the snapshot of generate-portfolio"""
+    main.generate_portfolio_main()
+    snapshot = load_snapshot()
+    assert snapshot is not None
+    assert snapshot["exchange_rates"] == {"EUR": 25}
+    assert snapshot["summary"]["A"]["actual_price"] == 20
+    assert set(snapshot["dividends"]) == {"A", "B"}
+    assert load_snapshot(max_age=-1) is None
+    snapshot_text = settings.SNAPSHOT_PATH.read_text(encoding="utf-8")
+    for malformed in ("[]", "{}", '{"created_at": 1}', "{"):
+        settings.SNAPSHOT_PATH.write_text(malformed, encoding="utf-8")
+        assert load_snapshot() is None
+    settings.SNAPSHOT_PATH.write_text(snapshot_text, encoding="utf-8")
+
+    api_mocks.pair_prices.reset_mock()
+    api_mocks.exchange_rates.reset_mock()
+    with patch("stock_summary.main.webbrowser.open"):
+        main.generate_html_main()
+        api_mocks.pair_prices.assert_not_called()
+        api_mocks.exchange_rates.assert_not_called()
+        assert "EUR" in (data_path / "index.html").read_text(encoding="utf-8")
+
+        with open(data_path / "entries", "a", encoding="utf-8") as entries:
+            entries.write("05/12/2023 A 1 20 500\n")
+        assert load_snapshot() is None
+        main.generate_html_main()
+    api_mocks.exchange_rates.assert_called()
+
+
+@block_network
+def test_dividend_without_quote(data_path: Path, api_mocks: ApiMocks) -> None:
+    """Testing that dividends of a pair without quote don't stop generate-portfolio"""
+    api_mocks.pair_prices.side_effect = lambda pairs: {
+        pair: PairResponse(currency="EUR", regularMarketPrice=20, symbol=pair)
+        for pair in pairs
+        if pair != "C"
+    }
+    with open(data_path / "dividends", "a", encoding="utf-8") as dividends:
+        dividends.write("\n20/12/2023 C 2 48\n")
+    main.generate_portfolio_main()
+    snapshot = load_snapshot()
+    assert snapshot is not None
+    assert snapshot["dividends"]["C"]["currency"] == ""
+    assert snapshot["dividends"]["A"]["currency"] == "EUR"
+
+
+@pytest.mark.usefixtures("api_mocks")
+@block_network
+def test_ledger_loaded_once(data_path: Path) -> None:
+    """Testing that ledger is loaded again only if the cloud sync changed files"""
+    with patch("stock_summary.main.sync_files_down") as sync_mock, patch.object(
+        Ledger, "load", wraps=Ledger.load
+    ) as load_mock:
+        sync_mock.return_value = [SyncStats(data_path / "entries", 0, 0.1)]
+        ledger, _, prices = main.sync_down_and_prefetch()
+        assert load_mock.call_count == 1
+        assert set(prices) == ledger.pairs == {"A", "B"}
+        sync_mock.return_value = [SyncStats(data_path / "entries", 10, 0.1)]
+        main.sync_down_and_prefetch()
+        assert load_mock.call_count == 3
+
+
+@block_network
+def test_sync_overlaps_prefetch(data_path: Path, api_mocks: ApiMocks) -> None:
+    """Testing that quotes and exchange rates are fetched while files are synced"""
+    fetched = {"quotes": threading.Event(), "rates": threading.Event()}
+    get_pair_prices_mock = api_mocks.pair_prices.side_effect
+
+    def get_pair_prices(pairs: Set[str]) -> Dict[str, PairResponse]:
+        fetched["quotes"].set()
+        return get_pair_prices_mock(pairs)  # type: ignore
+
+    def get_exchange_rates() -> Dict[str, float]:
+        fetched["rates"].set()
+        return {"EUR": 25}
+
+    api_mocks.pair_prices.side_effect = get_pair_prices
+    api_mocks.exchange_rates.side_effect = get_exchange_rates
+
+    def sync_files_down() -> List[SyncStats]:
+        # Blocked sync is released only by the concurrent fetches
+        assert all(event.wait(timeout=5) for event in fetched.values())
+        return [SyncStats(data_path / "entries", 0, 0.1)]
+
+    with patch("stock_summary.main.sync_files_down", side_effect=sync_files_down):
+        _, conversion_rates, prices = main.sync_down_and_prefetch()
+    assert conversion_rates == {"EUR": 25}
+    assert set(prices) == {"A", "B"}
+
+
+@block_network
+def test_sqlite_storage() -> None:
+    """Testing migration to the SQLite ledger and reading from it"""
+    testing_path = TESTING_DATASETS_PATH / "testing_data_A"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = Path(tmp_dir)
+        with patch.multiple(
+            settings,
+            ENTRIES_PATH=testing_path / "entries",
+            DIVIDEND_PATH=testing_path / "dividends",
+            PORTFOLIO_PATH=testing_path / "portfolio",
+            LEDGER_PATH=data_path / "ledger.sqlite",
+        ):
+            storage.migrate_to_sqlite()
+            text_entries = storage.read_entries(settings.ENTRIES_PATH)
+            text_portfolio = prepare_portfolio_data()
+            with patch.object(settings, "STORAGE_TYPE", StorageType.SQLITE):
+                assert storage.read_entries(settings.ENTRIES_PATH) == text_entries
+                assert get_dividend_sum() == 192
+                assert get_pairs() == {"A", "B"}
+                assert prepare_portfolio_data().equals(text_portfolio)
+                export_data(data_path / "export")
+        for name in ("entries", "dividends", "portfolio"):
+            assert storage.read_text_rows(
+                data_path / "export" / name, name
+            ) == storage.read_text_rows(testing_path / name, name)
+
+
+@block_network
+def test_entries_checkpoint() -> None:
+    """Testing that entries are aggregated from the checkpoint"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        entries_path = Path(tmp_dir) / "entries"
+        shutil.copy2(TESTING_DATASETS_PATH / "testing_data_A" / "entries", entries_path)
+        expected = {"A": Holding(5, -100), "B": Holding(5, 575)}
+        assert storage.aggregate_entries(entries_path) == expected
+        checkpoint = cache.load_checkpoint(str(entries_path.resolve()))
+        assert checkpoint is not None
+        storage.append_rows(
+            entries_path, storage.ENTRIES, [EntryRow("01/01/2023", "C", 2, 5, 250)]
+        )
+        parsed_rows: List[List[str]] = []
+        add_entries = storage._add_entries
+
+        def record_rows(totals: Dict[str, List[float]], rows: Any) -> None:
+            rows = list(rows)
+            parsed_rows.extend(rows)
+            add_entries(totals, rows)
+
+        with patch.object(storage, "_add_entries", side_effect=record_rows):
+            assert storage.aggregate_entries(entries_path) == {
+                **expected,
+                "C": Holding(2, 250),
+            }
+        assert parsed_rows == [["01/01/2023", "C", "2", "5", "250"]]
+        storage.write_text_rows(
+            entries_path,
+            storage.ENTRIES,
+            [EntryRow("01/01/2023", "D", 1, 1, 25)],
+            append=False,
+        )
+        assert storage.aggregate_entries(entries_path) == {"D": Holding(1, 25)}
+
+
+@block_network
+def test_ledger() -> None:
+    """Testing ledger loaded from the testing data"""
+    ledger = Ledger.load(
+        entries_path=TESTING_DATASETS_PATH / "testing_data_A" / "entries",
+        dividend_path=TESTING_DATASETS_PATH / "testing_data_A" / "dividends",
+    )
+    assert ledger.pairs == {"A", "B"}
+    assert ledger.holdings == {"A": Holding(5, -100), "B": Holding(5, 575)}
+    assert ledger.dividends == {"A": DividendTotal(5, 120), "B": DividendTotal(3, 72)}
+    assert ledger.cost_basis == 475
+    assert ledger.dividend_sum == 192
+
+
+@block_network
+def test_vectorized_valuation() -> None:
+    """Testing vectorized parsing and valuation of the entries"""
+    entries_path = TESTING_DATASETS_PATH / "testing_data_A" / "entries"
+    with patch.object(storage, "_VECTORIZED_PARSE_BYTES", 0):
+        holdings = storage.aggregate_entries(entries_path)
+    assert holdings == {"A": Holding(5, -100), "B": Holding(5, 575)}
+    PairResponse.pairs = {"A"}
+    dataset = value_holdings(
+        {**holdings, "B": Holding(0, 575)},
+        {"A": PairResponse(currency="EUR", regularMarketPrice=20, symbol="A")},
+        {"EUR": 25},
+    )
+    assert dataset["actual_basis"].tolist() == [2500, 0]
+    assert dataset["profit"].tolist() == [2600, -575]
+    assert to_summary(dataset)["B"] == {
+        "symbol": "B",
+        "actual_price": 0,
+        "actual_basis": 0,
+        "cost_basis": 575,
+        "count": 0,
+        "currency": "",
+    }
+
+
+@block_network
+def test_add_entries() -> None:
+    """Testing bulk import of the entries with batched lookups"""
+    PairResponse.pairs = {"A", "B"}
+    prices = {
+        "A": PairResponse(currency="EUR", regularMarketPrice=20, symbol="A"),
+        "B": PairResponse(currency="USD", regularMarketPrice=10, symbol="B"),
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = Path(tmp_dir)
+        shutil.copy2(TESTING_DATASETS_PATH / "testing_data_A" / "entries", data_path)
+        (data_path / "fills.csv").write_text(
+            "Stock,Date,Count,Price,Fee\n"
+            "A,10/01/2023,2,10,1\n"
+            "B,10/01/2023,1,20,1\n"
+            "A,11/01/2023,-1,15,1\n"
+        )
+        with patch.multiple(
+            settings, CLOUD_TYPE=CloudType.NONE, ENTRIES_PATH=data_path / "entries"
+        ), patch("stock_summary.library.get_pair_prices") as pair_prices_mock, patch(
+            "stock_summary.library.get_exchange_rates"
+        ) as exchange_mock:
+            pair_prices_mock.return_value = prices
+            exchange_mock.side_effect = lambda date, base: {
+                "EUR": 25 if date.day == 10 else 24,
+                "USD": 22,
+            }
+            main.add_entries_main(str(data_path / "fills.csv"))
+        assert pair_prices_mock.call_count == 1
+        assert exchange_mock.call_count == 2
+        assert storage.read_entries(data_path / "entries")[-3:] == [
+            EntryRow("10/01/2023", "A", 2, 10, 500),
+            EntryRow("10/01/2023", "B", 1, 20, 440),
+            EntryRow("11/01/2023", "A", -1, 15, -360),
+        ]
+
+
+@block_network
+def test_add_dividends() -> None:
+    """Testing bulk import of the dividends grouped by the payment date"""
+    PairResponse.pairs = {"A", "B"}
+    prices = {
+        "A": PairResponse(currency="EUR", regularMarketPrice=20, symbol="A"),
+        "B": PairResponse(currency="USD", regularMarketPrice=10, symbol="B"),
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = Path(tmp_dir)
+        shutil.copy2(TESTING_DATASETS_PATH / "testing_data_A" / "dividends", data_path)
+        (data_path / "statement.csv").write_text(
+            "date,stock,amount\n"
+            "10/01/2023,A,2\n"
+            "11/01/2023,B,1\n"
+            "10/01/2023,B,3\n"
+        )
+        with patch.multiple(
+            settings, CLOUD_TYPE=CloudType.NONE, DIVIDEND_PATH=data_path / "dividends"
+        ), patch("stock_summary.library.get_pair_prices") as pair_prices_mock, patch(
+            "stock_summary.library.get_exchange_rates"
+        ) as exchange_mock:
+            pair_prices_mock.return_value = prices
+            exchange_mock.side_effect = lambda date, base: {"EUR": 25, "USD": 22}
+            main.add_dividends_main(str(data_path / "statement.csv"))
+        assert pair_prices_mock.call_count == 1
+        assert exchange_mock.call_count == 2
+        assert storage.read_dividends(data_path / "dividends")[-3:] == [
+            DividendRow("10/01/2023", "A", 2, 50),
+            DividendRow("11/01/2023", "B", 1, 22),
+            DividendRow("10/01/2023", "B", 3, 66),
+        ]
+
+
+@block_network
+def test_record_validation() -> None:
+    """Testing that invalid rows are reported before any lookup"""
+    with patch("stock_summary.library.get_pair_prices") as pair_prices_mock:
+        for record in (
+            {"stock": "A", "date": "10/01/2023", "count": "", "price": "10"},
+            {"stock": "A", "date": "10/01/2023", "price": "10"},
+            {"stock": "", "date": "10/01/2023", "count": "1", "price": "10"},
+            {"stock": "A", "date": "10/01/2023", "count": "0", "price": "10"},
+        ):
+            with pytest.raises(ValueError, match="missing some of the values"):
+                prepare_entries([record])
+        with pytest.raises(ValueError, match="'count': 'two'"):
+            prepare_entries(
+                [{"stock": "A", "date": "10/01/2023", "count": "two", "price": "1"}]
+            )
+        with pytest.raises(ValueError, match="DD/MM/YYYY"):
+            prepare_dividends([{"stock": "A", "date": "2023-01-10", "amount": "2"}])
+        with pytest.raises(ValueError, match="missing some of the values"):
+            prepare_dividends([{"stock": "A", "date": "10/01/2023", "amount": ""}])
+    pair_prices_mock.assert_not_called()
+
+
+@block_network
+def test_backfill_portfolio() -> None:
+    """Testing backfill of the portfolio from the price histories"""
+
+    def price_history(pair: str) -> PriceHistory:
+        closes = {"A": {1: 10, 5: 12}, "B": {2: 5, 6: 6}}[pair]
+        return PriceHistory(
+            meta=HistoryMeta(symbol=pair, currency="EUR" if pair == "A" else "USD"),
+            items={
+                str(day): HistoryItem(
+                    date_utc=int(
+                        datetime.datetime(
+                            2022, 12, day, 14, 30, tzinfo=datetime.timezone.utc
+                        ).timestamp()
+                    ),
+                    close=close,
+                )
+                for day, close in closes.items()
+            },
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = Path(tmp_dir)
+        for name in ("entries", "dividends", "portfolio"):
+            shutil.copy2(TESTING_DATASETS_PATH / "testing_data_A" / name, data_path)
+        with patch.multiple(
+            settings,
+            ENTRIES_PATH=data_path / "entries",
+            DIVIDEND_PATH=data_path / "dividends",
+            PORTFOLIO_PATH=data_path / "portfolio",
+        ), patch(
+            "stock_summary.library.get_price_history", side_effect=price_history
+        ) as history_mock, patch(
+            "stock_summary.valuation.position_history", wraps=position_history
+        ) as positions_mock, patch(
+            "stock_summary.library.get_exchange_rates"
+        ) as exchange_mock:
+            exchange_mock.return_value = {"EUR": 25, "USD": 20}
+            added = backfill_portfolio(
+                datetime.datetime(2022, 11, 30), datetime.datetime(2022, 12, 6)
+            )
+        assert added == 2
+        assert history_mock.call_count == 2
+        assert positions_mock.call_count == 1
+        assert exchange_mock.call_count == 2
+        assert storage.read_portfolio(data_path / "portfolio") == [
+            PortfolioRow("01/12/22", 2300, 0),
+            PortfolioRow("02/12/22", 2875, 0),
+            PortfolioRow("05/12/22", 3500, 625),
+            PortfolioRow("06/12/22", 3600, 725),
+        ]
+
+
+def test_save_variables_to_file(tmp_path: Path) -> None:
+    """Testing that variables are saved to a new settings directory and updated"""
+    env_path = tmp_path / "settings" / ".env"
+    save_variables_to_file({"CLOUD_TYPE": "local", "LOCAL_CLOUD_PATH": "/nas"}, env_path)
+    save_variables_to_file({"STORAGE_TYPE": "sqlite"}, env_path)
+    variables = dotenv_values(env_path)
+    assert variables == {
+        "CLOUD_TYPE": "local",
+        "LOCAL_CLOUD_PATH": "/nas",
+        "STORAGE_TYPE": "sqlite",
+    }
+    assert [path.name for path in env_path.parent.iterdir()] == [".env"]